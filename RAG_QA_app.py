@@ -1,23 +1,85 @@
 import streamlit as st
-from langchain.chains.history_aware_retriever import create_history_aware_retriever
-from langchain.chains.retrieval import create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.chat_history import BaseChatMessageHistory
-from langchain_core.prompts import ChatPromptTemplate,MessagesPlaceholder
-from langchain_groq import ChatGroq
-import pypdf
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.vectorstores import FAISS
+from models import groq_llm,upload_embeddings
+from pdf_parsing import PDF_BACKENDS,parse_pdfs
+from chat_history import ChatHistoryStore,make_llm_summarizer
+from response_cache import ResponseCache
+from splitting import SPLITTER_MODE,chunk_sizes,make_splitter,overlap_report
+from tracing import show_trace_panel,start_metrics_server,tracer
+import tracing
+import hashlib
+import uuid
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
 os.environ['HF_TOKEN']=os.getenv("HF_TOKEN")
-embeddings=HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+start_metrics_server() ## no-op unless TRACE_METRICS_PORT is set
+
+## one bounded store per process: only a token-budgeted window of each
+## conversation is replayed, idle sessions are evicted, and with
+## CHAT_HISTORY_DB set histories live in SQLite instead of RAM
+@st.cache_resource
+def get_history_store(_llm):
+    summarizer=make_llm_summarizer(_llm) if os.getenv("CHAT_HISTORY_SUMMARY") else None
+    return ChatHistoryStore(summarizer=summarizer,sqlite_path=os.getenv("CHAT_HISTORY_DB"))
+
+## torch and the sentence-transformers weights load on the first use, not on page load
+@st.cache_resource(show_spinner="Loading embedding model...")
+def get_embeddings():
+    return upload_embeddings()
+
+@st.cache_resource
+def get_llm(api_key):
+    return groq_llm("gemma2-9b-it",api_key)
+
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(embeddings=get_embeddings())
+
+def get_session_history(session:str)->BaseChatMessageHistory:
+    return get_history_store(llm).get(session)
+
+def upload_key(uploaded_files):
+    """Order-independent content hash of the uploaded PDFs"""
+    return tuple(sorted(hashlib.sha256(uploaded_file.getvalue()).hexdigest() for uploaded_file in uploaded_files))
+
+## every keystroke reruns this script; keep the parsed, embedded and wired-up
+## chain per set of uploaded files so follow-up questions skip ingestion
+@st.cache_resource(show_spinner="Processing uploaded PDFs...",max_entries=16)
+def build_conversational_rag_chain(upload_key,pdf_backend,_llm,_uploaded_files):
+    ## faiss and the chain wiring are only needed once a PDF is uploaded
+    from embedding_pipeline import embed_into_faiss
+    from index_factory import apply_index_type
+    from rag_chains import create_conversational_rag_chain
+    embeddings=get_embeddings()
+    ## parse straight from the uploaded bytes, one worker process per file or page range;
+    ## sorted by content so the same set of files always builds the same index
+    uploads=sorted(((uploaded_file.name,uploaded_file.getvalue()) for uploaded_file in _uploaded_files),
+                   key=lambda upload:hashlib.sha256(upload[1]).hexdigest())
+    with tracer.trace("rag_qa","ingest"):
+        with tracing.stage("parse_pdfs"):
+            documnets,parse_stats=parse_pdfs(uploads,backend=pdf_backend)
+
+        ## split and create embeddings for the documents
+        ## SPLITTER_MODE=tokens keeps chunks within what all-MiniLM-L6-v2 actually reads (~256 tokens)
+        chunk_size,chunk_overlap=chunk_sizes(SPLITTER_MODE,embeddings,_llm,chars=(5000,500))
+        text_splitter=make_splitter(SPLITTER_MODE,chunk_size,chunk_overlap)
+        with tracing.stage("split"):
+            splits=text_splitter.split_documents(documnets)
+        chunk_stats=overlap_report(documnets,splits)
+        progress=st.progress(0.0,text="Embedding documents...")
+        def show_progress(done,total,rate):
+            progress.progress(done/total,text=f"Embedded {done}/{total} chunks ({rate:.1f} chunks/sec)")
+        with tracing.stage("embed_index",documents=len(splits)):
+            vectorstore=embed_into_faiss(splits,embeddings,on_progress=show_progress)
+        progress.empty()
+        ## FAISS_INDEX_TYPE applies here too; small uploads stay on the exact flat index
+        with tracing.stage("build_ann_index"):
+            retriever=apply_index_type(vectorstore).as_retriever()
+
+    conversational_rag_chain=create_conversational_rag_chain(_llm,retriever,get_session_history,get_response_cache())
+    return conversational_rag_chain,parse_stats,chunk_stats
 
 ## set up streamlit app
 st.title("Conversational RAG with PDF upload and chat history")
@@ -29,95 +91,40 @@ api_key=os.getenv('GROQ_API_KEY')
 
 ##check if groq api key is provided 
 if api_key:
-    llm=ChatGroq(groq_api_key=api_key,model_name="gemma2-9b-it")
+    llm=get_llm(api_key)
     ## chat interface
-    session_id=st.text_input("Session ID",value="default_session")
-
-    ## statefully manage chat history
-
-    if 'store' not in st.session_state:
-        st.session_state.store={}
+    ## histories are shared by the whole process, so default to an ID unique to this browser session
+    if 'default_session_id' not in st.session_state:
+        st.session_state.default_session_id=f"session-{uuid.uuid4().hex[:8]}"
+    session_id=st.text_input("Session ID",value=st.session_state.default_session_id)
     uploaded_files=st.file_uploader("Choose A PDF file",type="pdf",accept_multiple_files=True)
+    pdf_backend=st.sidebar.selectbox("PDF parser",PDF_BACKENDS,help="pymupdf is usually several times faster than pypdf")
 
     ## process uploaded PDF's
     if uploaded_files:
-       documnets=[]
-       for uploaded_file in uploaded_files:
-           temppdf=f"./temp.pdf"
-           with open(temppdf,"wb") as file:
-                file.write(uploaded_file.getvalue())
-                file_name=uploaded_file.name
-
-           loader=PyPDFLoader(temppdf)
-           docs=loader.load()
-           documnets.extend(docs)
-       
-    ## split and create embeddings for the documents
-       text_splitter=RecursiveCharacterTextSplitter(chunk_size=5000,chunk_overlap=500)
-       splits=text_splitter.split_documents(documnets)
-       vectorstore=FAISS.from_documents(documents=splits,embedding=embeddings)
-       retriever=vectorstore.as_retriever()
-    
-       contextualize_q_system_prompt = (
-        "Given a chat history and the latest user question "
-        "which might reference context in the chat history, "
-        "formulate a standalone question which can be understood "
-        "without the chat history. Do NOT answer the question, "
-        "just reformulate it if needed and otherwise return it as is."
-         )
-       contextualize_q_prompt=ChatPromptTemplate.from_messages([
-                        ("system",contextualize_q_system_prompt),
-                        MessagesPlaceholder("chat_history"),
-                        ("human","{input}"),
-                        ])
-
-       history_aware_retriever=create_history_aware_retriever(llm,retriever,contextualize_q_prompt)
-
-
-        ## answer question
-
-       system_prompt = (
-        "You are an assistant for question-answering tasks. "
-        "Use the following pieces of retrieved context to answer "
-        "the question. If you don't know the answer, say that you "
-        "don't know. Use three sentences maximum and keep the "
-        "answer concise."
-        "\n\n"
-        "{context}"
-        )
-
-       qa_prompt=ChatPromptTemplate.from_messages([
-                            ("system",system_prompt),
-                            MessagesPlaceholder("chat_history"),
-                            ("human","{input}")
-                        ])
-
-       question_answer_chain=create_stuff_documents_chain(llm,qa_prompt)
-       rag_chain=create_retrieval_chain(history_aware_retriever,question_answer_chain)
-
-       def get_session_history(session:str)->BaseChatMessageHistory:
-            if session_id not in st.session_state.store:
-               st.session_state.store[session_id]=ChatMessageHistory()
-            return st.session_state.store[session_id]
-
-       conversational_rag_chain=RunnableWithMessageHistory(
-                rag_chain,get_session_history,
-                input_messages_key="input",
-                history_messages_key="chat_history",
-                output_messages_key="answer"
-        )
+       conversational_rag_chain,parse_stats,chunk_stats=build_conversational_rag_chain(upload_key(uploaded_files),pdf_backend,llm,uploaded_files)
+       with st.expander("PDF parsing stats"):
+           for stat in parse_stats:
+               st.write(f"{stat['name']}: {stat['pages']} pages in {stat['seconds']:.2f}s")
+           st.write(f"{chunk_stats['chunks']} chunks, {chunk_stats['mean_chunk_tokens']:.0f} tokens on average, "
+                    f"overlap adds {chunk_stats['overlap_overhead']:.0%} to the embedded text")
        
        user_input=st.text_input("your questions:")
        if user_input:
           session_history=get_session_history(session_id)
-          response=conversational_rag_chain.invoke(
-              {"input":user_input},
-              config={
-                  "configurable":{"session_id":session_id}
-              },
-
-          )
+          with tracer.trace("rag_qa","chat") as trace:
+              response=conversational_rag_chain.invoke(
+                  {"input":user_input},
+                  config={
+                      "configurable":{"session_id":session_id},
+                      "callbacks":[trace]
+                  },
+
+              )
+          st.session_state.last_trace=trace.as_dict()
           st.write("Assistant:",response['answer'])
+
+    show_trace_panel(st.session_state.get("last_trace"))
     
 else:
     st.warning("connecting to GROQ API")
@@ -0,0 +1,243 @@
+"""
+Async HTTP service for research-paper Q&A, conversational RAG and URL summarization.
+
+    uvicorn api:app --host 0.0.0.0 --port 8000
+
+Models, prompts and the persisted FAISS index are loaded once at startup and
+shared by all requests. LLM calls are awaited through the async chain
+interfaces, so one process serves many users concurrently; at most
+API_MAX_CONCURRENT_REQUESTS run at once and the rest wait up to
+API_QUEUE_TIMEOUT_SECONDS before getting a 503. Pass "stream": true to
+/query or /chat to receive the answer as server-sent events. Per-stage
+timings and token counts are served in Prometheus format on /metrics.
+"""
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+
+import httpx
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from pydantic import BaseModel
+
+from chat_history import ChatHistoryStore, make_llm_summarizer
+from content_cache import ContentCache
+from hybrid_retrieval import BM25Index, CrossEncoderReranker, HybridRetriever
+from models import RESEARCH_PAPERS_DIR, RESEARCH_QA_MODEL, groq_llm, load_research_index, research_embeddings
+from rag_chains import create_conversational_rag_chain, research_prompt
+from response_cache import ResponseCache, document_ids, llm_identity
+from tracing import callbacks_config, tracer
+from url_summarizer import SUMMARY_MODEL, summarize_url
+
+PDF_DIR = RESEARCH_PAPERS_DIR
+QA_MODEL = RESEARCH_QA_MODEL
+CHAT_MODEL = "gemma2-9b-it"
+MAX_CONCURRENT_REQUESTS = int(os.getenv("API_MAX_CONCURRENT_REQUESTS", "32"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("API_QUEUE_TIMEOUT_SECONDS", "10"))
+
+
+class QueryRequest(BaseModel):
+    question: str
+    stream: bool = False
+
+
+class ChatRequest(BaseModel):
+    session_id: str
+    question: str
+    stream: bool = False
+
+
+class SummarizeRequest(BaseModel):
+    url: str
+
+
+## everything loaded at startup lives here for the lifetime of the process
+resources = {}
+request_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    load_dotenv()
+    groq_api_key = os.getenv("GROQ_API_KEY")
+    embeddings = research_embeddings()
+    qa_llm = groq_llm(QA_MODEL, groq_api_key)
+    chat_llm = groq_llm(CHAT_MODEL, groq_api_key)
+    ## same chunking as main.py, so both load the same persisted index
+    vectors = await asyncio.to_thread(load_research_index, embeddings, qa_llm, PDF_DIR, remote=True)
+
+    summarizer = make_llm_summarizer(chat_llm) if os.getenv("CHAT_HISTORY_SUMMARY") else None
+    history_store = ChatHistoryStore(summarizer=summarizer, sqlite_path=os.getenv("CHAT_HISTORY_DB"))
+    response_cache = ResponseCache(embeddings=embeddings)
+
+    resources.update(
+        vectors=vectors,
+        qa_llm=qa_llm,
+        document_chain=create_stuff_documents_chain(qa_llm, research_prompt),
+        summary_llm=groq_llm(SUMMARY_MODEL, groq_api_key),
+        response_cache=response_cache,
+        content_cache=ContentCache(),
+        http_client=httpx.AsyncClient(),
+    )
+    if vectors is not None:
+        retriever = HybridRetriever(vectorstore=vectors, bm25=BM25Index(vectors.docstore._dict.values()),
+                                    reranker=CrossEncoderReranker() if os.getenv("RERANKER") else None)
+        resources.update(
+            retriever=retriever,
+            chat_chain=create_conversational_rag_chain(chat_llm, retriever, history_store.get, response_cache),
+            ## the uncached variant streams tokens instead of returning one cached string
+            chat_stream_chain=create_conversational_rag_chain(chat_llm, retriever, history_store.get),
+        )
+    yield
+    await resources["http_client"].aclose()
+    resources.clear()
+
+
+app = FastAPI(title="llmapps", lifespan=lifespan)
+
+
+async def acquire_slot():
+    try:
+        await asyncio.wait_for(request_slots.acquire(), QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Server busy, try again shortly")
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def sse_response(events):
+    """Stream (event, data) pairs as server-sent events"""
+    try:
+        async for event, data in events:
+            yield sse(event, data)
+    except Exception as e:
+        yield sse("error", {"detail": f"{type(e).__name__}: {e}"})
+
+
+def stream_events(events):
+    """
+    SSE response for events. The request slot is released by a background
+    task, which also runs when the client disconnects before the body
+    iterator starts (a finally block in the generator would not).
+    """
+    return StreamingResponse(sse_response(events), media_type="text/event-stream",
+                             background=BackgroundTask(request_slots.release))
+
+
+def describe_sources(docs):
+    return [
+        {"chunk_id": chunk_id, "source": doc.metadata.get("source"), "page": doc.metadata.get("page")}
+        for chunk_id, doc in zip(document_ids(docs), docs)
+    ]
+
+
+def require_index():
+    if "retriever" not in resources:
+        raise HTTPException(status_code=503, detail=f"No PDF files found in {PDF_DIR}")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "index_loaded": "retriever" in resources}
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(tracer.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+
+async def retrieve_for_query(question, trace):
+    """(context, cache key, cache scope, cached answer or None) for a /query question"""
+    context = await resources["retriever"].ainvoke(question, config=callbacks_config(trace))
+    chunk_ids = document_ids(context)
+    qa_llm, cache = resources["qa_llm"], resources["response_cache"]
+    key = cache.make_key(*llm_identity(qa_llm), research_prompt.pretty_repr(), question, chunk_ids)
+    scope = (*llm_identity(qa_llm), *chunk_ids)
+    ## the similarity layer may call the embedding API, keep it off the event loop
+    cached = await asyncio.to_thread(cache.get, key, question, scope)
+    return context, key, scope, cached
+
+
+@app.post("/query")
+async def query(request: QueryRequest):
+    require_index()
+    await acquire_slot()
+    question = request.question
+    cache = resources["response_cache"]
+
+    if request.stream:
+        async def events():
+            with tracer.trace("api", "query") as trace:
+                context, key, scope, cached = await retrieve_for_query(question, trace)
+                yield "context", {"sources": describe_sources(context)}
+                if cached is not None:
+                    yield "token", {"text": cached}
+                else:
+                    tokens = []
+                    inputs = {"input": question, "context": context}
+                    async for token in resources["document_chain"].astream(inputs, callbacks_config(trace)):
+                        tokens.append(token)
+                        yield "token", {"text": token}
+                    await asyncio.to_thread(cache.put, key, "".join(tokens), question, scope)
+            yield "done", {}
+
+        return stream_events(events())
+
+    try:
+        with tracer.trace("api", "query") as trace:
+            context, key, scope, cached = await retrieve_for_query(question, trace)
+            answer = cached
+            if answer is None:
+                inputs = {"input": question, "context": context}
+                answer = await resources["document_chain"].ainvoke(inputs, callbacks_config(trace))
+                await asyncio.to_thread(cache.put, key, answer, question, scope)
+        return {"answer": answer, "sources": describe_sources(context), "cached": cached is not None}
+    finally:
+        request_slots.release()
+
+
+@app.post("/chat")
+async def chat(request: ChatRequest):
+    require_index()
+    await acquire_slot()
+    inputs = {"input": request.question}
+    config = {"configurable": {"session_id": request.session_id}}
+    if request.stream:
+        async def events():
+            with tracer.trace("api", "chat") as trace:
+                async for chunk in resources["chat_stream_chain"].astream(inputs, callbacks_config(trace, config)):
+                    if "context" in chunk:
+                        yield "context", {"sources": describe_sources(chunk["context"])}
+                    if "answer" in chunk:
+                        yield "token", {"text": chunk["answer"]}
+            yield "done", {}
+
+        return stream_events(events())
+    try:
+        with tracer.trace("api", "chat") as trace:
+            response = await resources["chat_chain"].ainvoke(inputs, callbacks_config(trace, config))
+        return {"answer": response["answer"], "sources": describe_sources(response["context"])}
+    finally:
+        request_slots.release()
+
+
+@app.post("/summarize")
+async def summarize(request: SummarizeRequest):
+    await acquire_slot()
+    try:
+        with tracer.trace("api", "summarize") as trace:
+            result = await summarize_url(request.url, resources["summary_llm"], resources["content_cache"],
+                                         client=resources["http_client"], config=callbacks_config(trace))
+    finally:
+        request_slots.release()
+    if result["status"] == "error":
+        raise HTTPException(status_code=502, detail=result.get("error"))
+    if result["status"] != "ok":
+        raise HTTPException(status_code=422, detail=result["status"])
+    return result
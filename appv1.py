@@ -3,14 +3,18 @@ import openai
 from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from models import research_embeddings
+from response_cache import RESPONSE_CACHE_SIMILARITY,ResponseCache
+from tracing import callbacks_config,percentile,show_trace_panel,start_metrics_server,tracer
+from collections import deque
+import httpx
 import os
+import time
 from dotenv import load_dotenv
 load_dotenv()
 
-## Langsmith Tracking
-os.environ["LANGCHAIN_API_KEY"]="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"
-os.environ["LANGCHAIN_TRACING_V2"]="true"
-os.environ["LANGCHAIN_PROJECT"]="Simple Q&A Chatbot With OPENAI"
+## local per-stage tracing (see tracing.py) instead of sending every prompt to LangSmith
+start_metrics_server() ## no-op unless TRACE_METRICS_PORT is set
 ## promopt template
 
 prompt=ChatPromptTemplate.from_messages(
@@ -20,16 +24,53 @@ prompt=ChatPromptTemplate.from_messages(
     ]
 )
 
-def genearte_response(question,api_key,llm,temperature,max_tokens):
+## shared by every session of this process
+@st.cache_resource
+def get_response_cache():
+    ## the similarity layer embeds every question, so only load embeddings when it is switched on
+    return ResponseCache(embeddings=research_embeddings() if RESPONSE_CACHE_SIMILARITY else None)
+
+## one keep-alive connection pool for all chat models, so follow-up
+## questions skip the TCP and TLS handshakes
+@st.cache_resource
+def get_http_client():
+    return httpx.Client(limits=httpx.Limits(max_connections=50,max_keepalive_connections=20),timeout=60.0)
+
+## pre-built prompt|llm|parser chains, one per (model, temperature, max_tokens)
+@st.cache_resource(max_entries=32)
+def get_chain(llm,temperature,max_tokens,_api_key):
     ##openai.api_key=api_key
-    llm=ChatOpenAI(model=llm,
+    chat_model=ChatOpenAI(model=llm,
                    temperature=temperature,
                    max_tokens=max_tokens,
-                   openai_api_key=api_key)
+                   openai_api_key=_api_key,
+                   http_client=get_http_client())
     output_parser=StrOutputParser()
-    chain=prompt|llm|output_parser
-    answer=chain.invoke({'question':question})
-    return answer
+    return prompt|chat_model|output_parser
+
+## (time to first token, total time) of recent LLM answers, for the sidebar p50/p95;
+## cache hits are left out so the figures stay comparable across changes
+@st.cache_resource
+def get_latency_log():
+    return deque(maxlen=1000)
+
+def response_key(question,llm,temperature,max_tokens):
+    return ResponseCache.make_key(llm,temperature,max_tokens,prompt.pretty_repr(),question)
+
+def stream_response(question,api_key,llm,temperature,max_tokens,config=None):
+    """Yield the answer token by token, caching it once complete"""
+    cache=get_response_cache()
+    key=response_key(question,llm,temperature,max_tokens)
+    scope=(llm,temperature,max_tokens)
+    cached=cache.get(key,question,scope)
+    if cached is not None:
+        yield cached
+        return
+    tokens=[]
+    for token in get_chain(llm,temperature,max_tokens,api_key).stream({'question':question},config):
+        tokens.append(token)
+        yield token
+    cache.put(key,"".join(tokens),question,scope)
 
 ## title of the app
 
@@ -51,7 +92,29 @@ st.write("go ahead and ask any question")
 user_input=st.text_input("You:")
 
 if user_input:
-    response = genearte_response(user_input, api_key, llm, temperature, max_tokens)
-    st.write(response)
+    placeholder=st.empty()
+    start=time.perf_counter()
+    first_token=None
+    response=""
+    with tracer.trace("chatbot","answer") as trace:
+        for token in stream_response(user_input, api_key, llm, temperature, max_tokens, callbacks_config(trace)):
+            if first_token is None:
+                first_token=time.perf_counter()-start
+            response+=token
+            placeholder.markdown(response+"▌")
+    placeholder.markdown(response)
+    st.session_state.last_trace=trace.as_dict()
+
+    latencies=get_latency_log()
+    if not trace.counters["response_cache.hit"]:
+        latencies.append((first_token or 0.0,time.perf_counter()-start))
+    if latencies:
+        ttft=[l[0] for l in latencies]
+        total=[l[1] for l in latencies]
+        st.sidebar.caption(f"Time to first token p50/p95: {percentile(ttft,0.5):.2f}s / {percentile(ttft,0.95):.2f}s")
+        st.sidebar.caption(f"Full answer p50/p95: {percentile(total,0.5):.2f}s / {percentile(total,0.95):.2f}s")
+    st.sidebar.caption(f"Response cache: {get_response_cache().stats()}")
 else:
     st.write("Please provide a query.")
+
+show_trace_panel(st.session_state.get("last_trace"))
@@ -0,0 +1,160 @@
+"""
+Summarize a list of URLs headlessly.
+
+    python batch_summarize.py --input urls.jsonl --output summaries.jsonl
+
+Every input line is a JSON object with a "url" (and optionally an "id").
+Results are appended to the output file as they finish, one JSON object per
+line; rerunning with the same output skips URLs that already have a final
+result, so an interrupted run resumes where it stopped. A throughput and
+per-stage timing report is printed at the end; set TRACE_LOG to also get a
+JSONL trace per URL.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+from content_cache import ContentCache
+from models import groq_llm
+from tracing import callbacks_config, percentile, tracer
+from url_summarizer import NEGATIVE_STATUSES, SUMMARY_MODEL, summarize_url
+
+## results with these statuses are final and skipped on resume; errors are retried
+FINAL_STATUSES = ("ok", "invalid_url", *NEGATIVE_STATUSES)
+
+
+class RateLimiter:
+    """Token bucket allowing per_minute acquisitions per minute; 0 disables the limit"""
+
+    def __init__(self, per_minute, burst=1):
+        self.rate = per_minute / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def read_requests(path):
+    """(id, url) of every input line that has a url"""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("url"):
+                records.append((str(record.get("id") or record["url"]), record["url"]))
+    return records
+
+
+def read_checkpoint(path):
+    """IDs that already have a final result in the output file"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  ## a line cut short by an interrupted run
+            if result.get("status") in FINAL_STATUSES:
+                done.add(result["id"])
+    return done
+
+
+class BatchSummarizer:
+    def __init__(self, llm, content_cache, concurrency, limits):
+        self.llm = llm
+        self.content_cache = content_cache
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limits = limits
+        self.client = None
+
+    async def summarize_one(self, record_id, url):
+        async with self.semaphore:
+            with tracer.trace("batch_summarize", "summarize_url") as trace:
+                result = await summarize_url(url, self.llm, self.content_cache, self.client, self.limits,
+                                             config=callbacks_config(trace))
+        return {"id": record_id, **result}
+
+    async def run(self, records, output_path):
+        stats = {"ok": 0, "failed": 0, "cached": 0}
+        stage_times = {}
+        started = time.perf_counter()
+        async with httpx.AsyncClient() as client:
+            self.client = client
+            tasks = [asyncio.create_task(self.summarize_one(record_id, url)) for record_id, url in records]
+            with open(output_path, "a", encoding="utf-8") as out:
+                for done, task in enumerate(asyncio.as_completed(tasks), 1):
+                    result = await task
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    out.flush()
+                    stats["ok" if result["status"] == "ok" else "failed"] += 1
+                    stats["cached"] += result["cached"]
+                    for stage, seconds in result["timings"].items():
+                        stage_times.setdefault(stage, []).append(seconds)
+                    print(f"[{done}/{len(records)}] {result['status']} {result['url']}", file=sys.stderr)
+        elapsed = time.perf_counter() - started
+        return {
+            "processed": len(records),
+            **stats,
+            "elapsed_seconds": round(elapsed, 3),
+            "urls_per_minute": round(len(records) / elapsed * 60, 2) if elapsed else 0.0,
+            "stages": {
+                stage: {"count": len(times), "p50": round(percentile(times, 0.5), 3),
+                        "p95": round(percentile(times, 0.95), 3), "max": round(max(times), 3)}
+                for stage, times in stage_times.items()
+            },
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize the URLs listed in a JSONL file")
+    parser.add_argument("--input", default="requests.jsonl", help="JSONL file with one {\"url\": ...} per line")
+    parser.add_argument("--output", default="summaries.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=int, default=8, help="URLs processed at the same time")
+    parser.add_argument("--youtube-rpm", type=int, default=60, help="transcript lookups per minute (0 = unlimited)")
+    parser.add_argument("--web-rpm", type=int, default=120, help="web page loads per minute (0 = unlimited)")
+    parser.add_argument("--llm-rpm", type=int, default=30, help="LLM calls per minute, map-reduce steps included (0 = unlimited)")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    records = read_requests(args.input)
+    done = read_checkpoint(args.output)
+    pending = [(record_id, url) for record_id, url in records if record_id not in done]
+    print(f"{len(records)} URLs, {len(records) - len(pending)} already done, {len(pending)} to go", file=sys.stderr)
+
+    llm = groq_llm(SUMMARY_MODEL)
+    limits = {
+        "youtube": RateLimiter(args.youtube_rpm),
+        "web": RateLimiter(args.web_rpm),
+        "llm": RateLimiter(args.llm_rpm),
+    }
+    summarizer = BatchSummarizer(llm, ContentCache(), args.concurrency, limits)
+    report = asyncio.run(summarizer.run(pending, args.output))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
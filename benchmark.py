@@ -0,0 +1,353 @@
+"""
+Offline benchmark of the ingestion and query paths of main.py and RAG_QA_app.py.
+
+    python benchmark.py --papers 20 --pages 10 --queries 50 --llm-latency 0.3
+
+Runs against a synthetic PDF corpus (or --corpus DIR) with a deterministic
+hashing embedding (or the local all-MiniLM-L6-v2 model via --embeddings hf)
+and a fake chat model with configurable latency, so no API key or network is
+needed. Prints JSON with wall-clock count/mean/p50/p95/p99 per stage,
+throughput and peak RSS.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from chat_history import ChatHistoryStore
+from embedding_pipeline import embed_into_faiss
+from hybrid_retrieval import HYBRID_K, BM25Index, HybridRetriever, bm25_tokenize
+from index_factory import INDEX_TYPE
+from pdf_parsing import parse_pdfs
+from rag_chains import contextualize_q_prompt, create_conversational_rag_chain, research_prompt
+from splitting import make_splitter, overlap_report
+from tokens import estimate_tokens
+from tracing import percentile
+from vector_store import list_pdfs, load_or_build_index
+
+## same splitter settings as the apps
+RESEARCH_CHUNK_SIZE, RESEARCH_CHUNK_OVERLAP = 1000, 200
+UPLOAD_CHUNK_SIZE, UPLOAD_CHUNK_OVERLAP = 5000, 500
+## (mode, chunk_size, chunk_overlap) compared by --chunking-sweep
+CHUNKING_SWEEP = (
+    ("chars", 1000, 200),
+    ("chars", 5000, 500),
+    ("tokens", 128, 13),
+    ("tokens", 256, 26),
+    ("tokens", 375, 38),
+    ("tokens", 512, 51),
+)
+
+VOCABULARY = (
+    "attention transformer encoder decoder embedding retrieval gradient optimizer dropout layer "
+    "token sequence corpus benchmark baseline accuracy latency throughput quantization pruning "
+    "distillation fine-tuning pretraining contrastive objective loss dataset evaluation ablation "
+    "convolution recurrent memory context window positional encoding softmax normalization "
+    "residual parameter scaling inference batch training model language vision speech graph "
+    "the of and to in a is for on with by as that are from we our this model results show"
+).split()
+
+
+class HashingEmbeddings(Embeddings):
+    """Bag-of-words feature hashing: deterministic, offline, and similar texts get similar vectors"""
+
+    def __init__(self, dim=384, latency=0.0):
+        self.dim = dim
+        self.latency = latency  ## per embed_documents call, like one API round trip
+        self.model = f"hashing-{dim}"
+
+    def _embed(self, text):
+        vector = [0.0] * self.dim
+        for token in bm25_tokenize(text):
+            h = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+            vector[h % self.dim] += 1.0 if h >> 63 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers with canned text after latency seconds plus answer tokens / tokens_per_second"""
+
+    answer: str = "The context describes the method, its training setup and the reported results."
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        delay = self.latency
+        if self.tokens_per_second:
+            delay += len(self.answer.split()) / self.tokens_per_second
+        time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+
+def make_corpus(pdf_dir, papers, pages, words_per_page=350, seed=0):
+    """Write papers PDFs of pages pages of random technical-sounding sentences"""
+    import pymupdf
+
+    rng = random.Random(seed)
+    os.makedirs(pdf_dir, exist_ok=True)
+    for paper in range(papers):
+        pdf = pymupdf.open()
+        for _ in range(pages):
+            words = [rng.choice(VOCABULARY) for _ in range(words_per_page)]
+            sentences = [" ".join(words[i:i + 12]).capitalize() + "." for i in range(0, len(words), 12)]
+            pdf.new_page().insert_textbox(pymupdf.Rect(50, 50, 545, 792), " ".join(sentences), fontsize=8)
+        pdf.save(os.path.join(pdf_dir, f"paper_{paper:04d}.pdf"))
+        pdf.close()
+
+
+def make_questions(count, seed=0):
+    """(standalone question, follow-up question) pairs; the follow-up needs the history to be understood"""
+    rng = random.Random(seed)
+    terms = [w for w in VOCABULARY if len(w) > 4]
+    return [
+        (f"How does {rng.choice(terms)} affect {rng.choice(terms)} during {rng.choice(terms)}?",
+         f"And what about its {rng.choice(terms)}?")
+        for _ in range(count)
+    ]
+
+
+def read_questions(path):
+    """Recorded questions, one {"question": ..., "follow_up": ...} JSON object per line"""
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [(r["question"], r.get("follow_up") or "And what about its limitations?") for r in records]
+
+
+class StageTimer:
+    """Wall-clock durations per stage name"""
+
+    def __init__(self):
+        self.times = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times.setdefault(name, []).append(time.perf_counter() - started)
+
+    def report(self):
+        return {
+            name: {
+                "count": len(times),
+                "mean_ms": round(sum(times) / len(times) * 1000, 3),
+                **{f"p{q}_ms": round(percentile(times, q / 100) * 1000, 3) for q in (50, 95, 99)},
+            }
+            for name, times in self.times.items()
+        }
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    ## ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+def bench_ingestion(pdf_dir, embeddings, timer, repeat, index_type):
+    """Returns (research-paper store, chunks per ingestion) after repeat cold + warm builds"""
+    paths = list_pdfs(pdf_dir)
+    files = []
+    for path in paths:
+        with open(path, "rb") as f:
+            files.append((os.path.basename(path), f.read()))
+    research_splitter = RecursiveCharacterTextSplitter(chunk_size=RESEARCH_CHUNK_SIZE,
+                                                       chunk_overlap=RESEARCH_CHUNK_OVERLAP, add_start_index=True)
+    upload_splitter = RecursiveCharacterTextSplitter(chunk_size=UPLOAD_CHUNK_SIZE, chunk_overlap=UPLOAD_CHUNK_OVERLAP)
+
+    vectors, chunk_count = None, 0
+    for _ in range(repeat):
+        ## main.py: PyPDFLoader, 1000/200 chunks, persisted incremental index
+        with timer.stage("research_qa.load"):
+            pages = [page for path in paths for page in PyPDFLoader(path).load()]
+        with timer.stage("research_qa.split"):
+            chunks = research_splitter.split_documents(pages)
+        with timer.stage("research_qa.embed_index"):
+            embed_into_faiss(chunks, embeddings)
+        chunk_count = len(chunks)
+        with tempfile.TemporaryDirectory() as index_dir:
+            with timer.stage("research_qa.index_cold"):
+                load_or_build_index(pdf_dir, embeddings, RESEARCH_CHUNK_SIZE, RESEARCH_CHUNK_OVERLAP,
+                                    index_dir=index_dir, index_type=index_type)
+            ## loaded into memory: index_dir is gone once the queries run
+            with timer.stage("research_qa.index_warm"):
+                vectors = load_or_build_index(pdf_dir, embeddings, RESEARCH_CHUNK_SIZE, RESEARCH_CHUNK_OVERLAP,
+                                              index_dir=index_dir, index_type=index_type, mmap=False)
+
+        ## RAG_QA_app.py: parallel in-memory parsing, 5000/500 chunks, in-memory index
+        with timer.stage("rag_qa.parse"):
+            documents, _ = parse_pdfs(files)
+        with timer.stage("rag_qa.split"):
+            splits = upload_splitter.split_documents(documents)
+        with timer.stage("rag_qa.embed_index"):
+            embed_into_faiss(splits, embeddings)
+    return vectors, chunk_count
+
+
+def bench_queries(vectors, llm, questions, timer, concurrency):
+    """Returns queries per second of the research Q&A path at the given concurrency"""
+    retriever = HybridRetriever(vectorstore=vectors, bm25=BM25Index(vectors.docstore._dict.values()))
+    document_chain = create_stuff_documents_chain(llm, research_prompt)
+
+    def research_qa(question):
+        with timer.stage("research_qa.total"):
+            with timer.stage("research_qa.retrieve"):
+                context = retriever.invoke(question)
+            with timer.stage("research_qa.generate"):
+                document_chain.invoke({"input": question, "context": context})
+
+    ## main.py, one question at a time
+    for question, _ in questions:
+        research_qa(question)
+
+    ## RAG_QA_app.py: a standalone question, then a follow-up that needs the rewrite
+    rewrite_chain = contextualize_q_prompt | llm | StrOutputParser()
+    history_store = ChatHistoryStore()
+    chat_chain = create_conversational_rag_chain(llm, vectors.as_retriever(), history_store.get)
+    for session, (question, follow_up) in enumerate(questions):
+        session_id = f"bench-{session}"
+        config = {"configurable": {"session_id": session_id}}
+        with timer.stage("rag_qa.turn"):
+            chat_chain.invoke({"input": question}, config)
+        with timer.stage("rag_qa.rewrite"):
+            rewrite_chain.invoke({"input": follow_up, "chat_history": history_store.get(session_id).messages})
+        with timer.stage("rag_qa.follow_up_turn"):
+            chat_chain.invoke({"input": follow_up}, config)
+
+    ## many users at once against one shared index
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(research_qa, [question for question, _ in questions]))
+    elapsed = time.perf_counter() - started
+    return len(questions) / elapsed if elapsed else 0.0
+
+
+def bench_chunking(pdf_dir, embeddings, questions, settings=CHUNKING_SWEEP, k=HYBRID_K):
+    """Index size against query cost (top-k context tokens stuffed into the prompt) per splitter setting"""
+    pages = [page for path in list_pdfs(pdf_dir) for page in PyPDFLoader(path).load()]
+    rows = []
+    for mode, chunk_size, chunk_overlap in settings:
+        chunks = make_splitter(mode, chunk_size, chunk_overlap).split_documents(pages)
+        started = time.perf_counter()
+        store = embed_into_faiss(chunks, embeddings)
+        embed_seconds = time.perf_counter() - started
+        latencies, context_tokens = [], []
+        for question, _ in questions:
+            started = time.perf_counter()
+            docs = store.similarity_search(question, k=k)
+            latencies.append(time.perf_counter() - started)
+            context_tokens.append(sum(estimate_tokens(doc.page_content) for doc in docs))
+        ## float32 vectors plus the chunk text kept in the docstore
+        index_bytes = store.index.ntotal * store.index.d * 4 + sum(len(c.page_content.encode()) for c in chunks)
+        rows.append({
+            "mode": mode,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            **overlap_report(pages, chunks),
+            "index_mb": round(index_bytes / 2 ** 20, 3),
+            "embed_seconds": round(embed_seconds, 3),
+            "retrieve_p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+            "context_tokens_mean": round(sum(context_tokens) / len(context_tokens), 1) if context_tokens else 0.0,
+            "context_tokens_p95": round(percentile(context_tokens, 0.95), 1),
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline ingestion and query benchmark")
+    parser.add_argument("--corpus", help="directory of PDFs to use instead of a synthetic corpus")
+    parser.add_argument("--papers", type=int, default=10, help="synthetic corpus: number of PDFs")
+    parser.add_argument("--pages", type=int, default=10, help="synthetic corpus: pages per PDF")
+    parser.add_argument("--questions", help="JSONL of recorded {\"question\", \"follow_up\"} to ask")
+    parser.add_argument("--queries", type=int, default=30, help="synthetic questions to ask")
+    parser.add_argument("--repeat", type=int, default=3, help="ingestion repetitions")
+    parser.add_argument("--embeddings", choices=("stub", "hf"), default="stub",
+                        help="hashing stub or the local all-MiniLM-L6-v2 model")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="stub: seconds per embedding batch")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="fake LLM: seconds per call")
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=0.0, help="fake LLM: output speed (0 = instant)")
+    parser.add_argument("--index-type", default=INDEX_TYPE, help="FAISS index type, see index_factory.py")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel queries for the throughput run")
+    parser.add_argument("--chunking-sweep", action="store_true",
+                        help="also compare index size and query cost of the CHUNKING_SWEEP splitter settings")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.embeddings == "hf":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    else:
+        embeddings = HashingEmbeddings(latency=args.embed_latency)
+    llm = FakeChatModel(latency=args.llm_latency, tokens_per_second=args.llm_tokens_per_sec)
+    questions = read_questions(args.questions) if args.questions else make_questions(args.queries)
+    timer = StageTimer()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        pdf_dir = args.corpus
+        if pdf_dir is None:
+            pdf_dir = os.path.join(scratch, "papers")
+            make_corpus(pdf_dir, args.papers, args.pages)
+        started = time.perf_counter()
+        vectors, chunk_count = bench_ingestion(pdf_dir, embeddings, timer, args.repeat, args.index_type)
+        if vectors is None:
+            parser.error(f"No PDF files found in {pdf_dir}")
+        ingestion_seconds = time.perf_counter() - started
+        queries_per_second = bench_queries(vectors, llm, questions, timer, args.concurrency)
+        chunking = bench_chunking(pdf_dir, embeddings, questions) if args.chunking_sweep else None
+
+    stages = timer.report()
+    embed_mean = stages["research_qa.embed_index"]["mean_ms"] / 1000
+    report = {
+        "config": {**vars(args), "pdfs": len(list_pdfs(pdf_dir)) if args.corpus else args.papers,
+                   "chunks": chunk_count, "questions": len(questions)},
+        "stages": stages,
+        "throughput": {
+            "ingestion_seconds": round(ingestion_seconds, 3),
+            "embed_chunks_per_sec": round(chunk_count / embed_mean, 1) if embed_mean else None,
+            "queries_per_sec": round(queries_per_second, 2),
+        },
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_children_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+    if chunking is not None:
+        report["chunking"] = chunking
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
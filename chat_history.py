@@ -0,0 +1,201 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import SystemMessage, messages_from_dict, messages_to_dict
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from tokens import message_tokens
+
+HISTORY_MAX_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "1500"))
+HISTORY_MAX_SESSIONS = int(os.getenv("CHAT_HISTORY_MAX_SESSIONS", "1000"))
+HISTORY_TTL_SECONDS = int(os.getenv("CHAT_HISTORY_TTL_SECONDS", "3600"))
+## persisted histories idle for longer than this are deleted from CHAT_HISTORY_DB
+HISTORY_DB_TTL_SECONDS = int(os.getenv("CHAT_HISTORY_DB_TTL_SECONDS", str(7 * 24 * 3600)))
+HISTORY_DB_PURGE_INTERVAL_SECONDS = 600
+## with a summarizer the window is trimmed to this share of max_tokens, so the
+## summarizer runs once every few turns instead of on every turn over budget
+SUMMARY_TRIM_RATIO = 0.5
+
+summary_prompt = ChatPromptTemplate.from_template(
+    """
+    Progressively summarize the conversation below, adding onto the previous summary.
+    Keep names, numbers and the topics the user asked about. Return only the new summary.
+
+    Previous summary:
+    {summary}
+
+    New lines of conversation:
+    {lines}
+    """
+)
+
+
+def make_llm_summarizer(llm):
+    """summarizer(previous_summary, messages) -> new summary, backed by llm"""
+    chain = summary_prompt | llm | StrOutputParser()
+
+    def summarize(summary, messages):
+        lines = "\n".join(f"{m.type}: {m.content}" for m in messages)
+        return chain.invoke({"summary": summary or "(none)", "lines": lines}).strip()
+
+    return summarize
+
+
+class WindowedChatMessageHistory(BaseChatMessageHistory):
+    """
+    Chat history that only replays the most recent turns fitting in max_tokens.
+    Older turns are dropped, or folded into a rolling summary when a
+    summarizer is given; the summary is replayed as a system message.
+    Summarizing trims the window to SUMMARY_TRIM_RATIO of max_tokens, so
+    several turns are folded in per summarizer call.
+    """
+
+    def __init__(self, max_tokens=HISTORY_MAX_TOKENS, summarizer=None):
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self.recent = []
+        self.summary = ""
+
+    @property
+    def messages(self):
+        if self.summary:
+            return [SystemMessage(content=f"Summary of the earlier conversation: {self.summary}"), *self.recent]
+        return list(self.recent)
+
+    def add_message(self, message):
+        self.add_messages([message])
+
+    def add_messages(self, messages):
+        self.recent.extend(messages)
+        self._trim()
+
+    def clear(self):
+        self.recent = []
+        self.summary = ""
+
+    def _trim(self):
+        total = sum(message_tokens(m) for m in self.recent)
+        if total <= self.max_tokens:
+            return
+        target = self.max_tokens if self.summarizer is None else int(self.max_tokens * SUMMARY_TRIM_RATIO)
+        dropped = []
+        ## always keep the latest question/answer pair, even if it alone is over budget
+        while total > target and len(self.recent) > 2:
+            message = self.recent.pop(0)
+            total -= message_tokens(message)
+            dropped.append(message)
+        if dropped and self.summarizer is not None:
+            self.summary = self.summarizer(self.summary, dropped)
+
+
+class SQLiteChatMessageHistory(WindowedChatMessageHistory):
+    """WindowedChatMessageHistory whose window and summary are written through to SQLite"""
+
+    def __init__(self, session_id, conn, lock, **kwargs):
+        super().__init__(**kwargs)
+        self.session_id = session_id
+        self._conn = conn
+        self._lock = lock
+        with self._lock:
+            row = conn.execute(
+                "SELECT summary, messages FROM chat_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row:
+            self.summary = row[0]
+            self.recent = messages_from_dict(json.loads(row[1]))
+
+    def add_messages(self, messages):
+        super().add_messages(messages)
+        self._save()
+
+    def clear(self):
+        super().clear()
+        self._save()
+
+    def _save(self):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chat_sessions (session_id, summary, messages, last_used) VALUES (?, ?, ?, ?)",
+                (self.session_id, self.summary, json.dumps(messages_to_dict(self.recent)), time.time()),
+            )
+            self._conn.commit()
+
+
+class ChatHistoryStore:
+    """
+    Session ID -> chat history, for RunnableWithMessageHistory.
+
+    At most max_sessions histories are kept in memory; the least recently used
+    ones, and any idle for longer than ttl_seconds, are evicted. With
+    sqlite_path set, histories are persisted and reloaded on next use, so
+    eviction and restarts only cost a read; persisted histories idle for
+    longer than db_ttl_seconds are deleted.
+    """
+
+    def __init__(self, max_sessions=HISTORY_MAX_SESSIONS, ttl_seconds=HISTORY_TTL_SECONDS,
+                 max_tokens=HISTORY_MAX_TOKENS, summarizer=None, sqlite_path=None,
+                 db_ttl_seconds=HISTORY_DB_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.db_ttl_seconds = db_ttl_seconds
+        self._last_purge = 0.0
+        self.history_options = {"max_tokens": max_tokens, "summarizer": summarizer}
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn = None
+        if sqlite_path:
+            if os.path.dirname(sqlite_path):
+                os.makedirs(os.path.dirname(sqlite_path), exist_ok=True)
+            self._conn = sqlite3.connect(sqlite_path, check_same_thread=False, timeout=30)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_sessions ("
+                " session_id TEXT PRIMARY KEY, summary TEXT NOT NULL, messages TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chat_sessions_last_used ON chat_sessions (last_used)")
+            self._conn.commit()
+            self.purge_expired()
+
+    def purge_expired(self):
+        """Delete persisted histories idle for longer than db_ttl_seconds"""
+        if self._conn is None:
+            return
+        self._last_purge = time.time()
+        with self._db_lock:
+            self._conn.execute("DELETE FROM chat_sessions WHERE last_used < ?",
+                               (self._last_purge - self.db_ttl_seconds,))
+            self._conn.commit()
+
+    def _new_history(self, session_id):
+        if self._conn is not None:
+            return SQLiteChatMessageHistory(session_id, self._conn, self._db_lock, **self.history_options)
+        return WindowedChatMessageHistory(**self.history_options)
+
+    def get(self, session_id):
+        now = time.time()
+        with self._lock:
+            for stale_id, (_, last_used) in list(self._sessions.items()):
+                if now - last_used <= self.ttl_seconds:
+                    break  ## ordered oldest first, the rest are fresher
+                del self._sessions[stale_id]
+            if session_id in self._sessions:
+                history, _ = self._sessions.pop(session_id)
+            else:
+                history = self._new_history(session_id)
+            self._sessions[session_id] = (history, now)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        if now - self._last_purge > HISTORY_DB_PURGE_INTERVAL_SECONDS:
+            self.purge_expired()
+        return history
+
+    __call__ = get
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import tracing
+
+CONTENT_CACHE_PATH = os.getenv("CONTENT_CACHE_PATH", os.path.join(".cache", "url_content.sqlite"))
+CONTENT_CACHE_TTL_SECONDS = int(os.getenv("CONTENT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+## "no transcripts" style answers can change (captions get added), so keep them for less time
+CONTENT_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("CONTENT_CACHE_NEGATIVE_TTL_SECONDS", str(6 * 3600)))
+CONTENT_CACHE_MAX_BYTES = int(os.getenv("CONTENT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+## dropped by exact name, plus every utm_* parameter
+TRACKING_PARAMS = frozenset(("fbclid", "gclid", "ref", "si"))
+TRACKING_PREFIXES = ("utm_",)
+
+
+def is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def normalize_url(url):
+    """Canonical form of a web URL: lowercase host, no fragment, tracking parameters or trailing slash"""
+    parts = urlsplit(url.strip())
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not is_tracking_param(k)
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ""))
+
+
+def content_key(url, video_id=None):
+    """Cache key of a URL: the YouTube video ID when there is one, else the normalized URL"""
+    return f"youtube:{video_id}" if video_id else f"url:{normalize_url(url)}"
+
+
+class ContentCache:
+    """
+    On-disk cache of fetched URL content and its summary.
+
+    Each entry stores the text, where it came from (e.g. "manual_transcript",
+    "website") and optionally the summary together with a summary_key
+    identifying the model/prompt that produced it. Failed lookups are cached
+    as negative entries (text None, source holding the status) with a
+    shorter TTL. Once the stored text exceeds max_bytes, the least recently
+    used entries are evicted.
+    """
+
+    def __init__(self, path=CONTENT_CACHE_PATH, ttl_seconds=CONTENT_CACHE_TTL_SECONDS,
+                 negative_ttl_seconds=CONTENT_CACHE_NEGATIVE_TTL_SECONDS, max_bytes=CONTENT_CACHE_MAX_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS content ("
+            " key TEXT PRIMARY KEY, text TEXT, source TEXT NOT NULL, summary TEXT, summary_key TEXT,"
+            " size INTEGER NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        """The live entry for key as a dict, or None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, source, summary, summary_key FROM content WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                tracing.count("content_cache.miss")
+                return None
+            self._conn.execute("UPDATE content SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        text, source, summary, summary_key = row
+        tracing.count("content_cache.hit")
+        return {"text": text, "source": source, "summary": summary, "summary_key": summary_key,
+                "negative": text is None}
+
+    def put(self, key, text, source, summary=None, summary_key=None):
+        ttl = self.ttl_seconds if text is not None else self.negative_ttl_seconds
+        size = len(text or "") + len(summary or "")
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO content (key, text, source, summary, summary_key, size, expires_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, text, source, summary, summary_key, size, now + ttl, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def put_negative(self, key, status):
+        self.put(key, None, status)
+
+    def set_summary(self, key, summary, summary_key):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE content SET summary = ?, summary_key = ?, size = LENGTH(COALESCE(text, '')) + ? WHERE key = ?",
+                (summary, summary_key, len(summary), key),
+            )
+            self._conn.commit()
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM content WHERE expires_at <= ?", (now,))
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM content").fetchone()
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM content ORDER BY last_used"):
+            if total - freed <= self.max_bytes:
+                break
+            doomed.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM content WHERE key = ?", doomed)
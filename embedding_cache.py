@@ -0,0 +1,147 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import tracing
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+## last_used is only rewritten once it is this old, so repeated hits do not write to SQLite
+TOUCH_INTERVAL_SECONDS = 3600
+## eviction trims to this share of max_entries, so the next writes do not evict again
+EVICT_TO_RATIO = 0.9
+
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different copies of a chunk share one vector"""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def text_key(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def embedding_model_name(embeddings):
+    model = getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None)
+    return f"{type(embeddings).__name__}:{model}"
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps any LangChain embedding backend with a local SQLite cache keyed by
+    (model name, normalized text hash). Vectors are stored as raw float32
+    blobs and the least recently used rows are evicted past max_entries.
+    The row count is tracked in memory (an over-estimate when rows are
+    replaced or other processes write), so the table is only counted when
+    the estimate crosses max_entries.
+    """
+
+    def __init__(self, underlying, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.underlying = underlying
+        self.model = embedding_model_name(underlying)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._rows = None
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def _lookup(self, keys):
+        found, stale = {}, []
+        unique = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._lock:
+            ## stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector, last_used FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                    [self.model, *batch],
+                ).fetchall()
+                found.update((key, np.frombuffer(blob, dtype=np.float32).tolist()) for key, blob, _ in rows)
+                stale.extend(key for key, _, last_used in rows if now - last_used > TOUCH_INTERVAL_SECONDS)
+            if stale:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                    [(now, self.model, key) for key in stale],
+                )
+                self._conn.commit()
+        return found
+
+    def _store(self, items):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, key, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(self.model, key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items],
+            )
+            if self._rows is None:
+                (self._rows,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            else:
+                self._rows += len(items)
+            if self._rows > self.max_entries:
+                (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+                self._rows = count
+                if count > self.max_entries:
+                    keep = int(self.max_entries * EVICT_TO_RATIO)
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE rowid IN "
+                        "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (count - keep,),
+                    )
+                    self._rows = keep
+            self._conn.commit()
+
+    def _record(self, hits, misses):
+        ## embed_documents runs on several embedding workers at once
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        if hits:
+            tracing.count("embedding_cache.hit", hits)
+        if misses:
+            tracing.count("embedding_cache.miss", misses)
+
+    def embed_documents(self, texts):
+        keys = [text_key(t) for t in texts]
+        found = self._lookup(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self._record(len(texts) - len(missing), len(missing))
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed.items())
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text):
+        ## some models embed queries differently from documents, so keep them apart
+        key = "query:" + text_key(text)
+        found = self._lookup([key])
+        if key in found:
+            self._record(1, 0)
+            return found[key]
+        self._record(0, 1)
+        vector = self.underlying.embed_query(text)
+        self._store([(key, vector)])
+        return vector
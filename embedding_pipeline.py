@@ -0,0 +1,87 @@
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+
+from langchain_community.vectorstores import FAISS
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError"}
+
+
+def is_retryable(exc):
+    """Rate limits, timeouts and 5xx from a remote embedding API are worth another try"""
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    if getattr(exc, "status_code", None) in RETRYABLE_STATUS:
+        return True
+    return type(exc).__name__ in RETRYABLE_ERRORS
+
+
+def with_retries(fn, max_retries=5, base_delay=0.5, max_delay=20.0):
+    """Call fn, retrying retryable errors with jittered exponential backoff"""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+
+def embed_into_faiss(documents, embeddings, vectorstore=None, ids=None, batch_size=EMBED_BATCH_SIZE,
+                     max_workers=EMBED_WORKERS, remote=False, on_progress=None):
+    """
+    Embed documents in batches on a bounded worker pool and add every batch
+    to the FAISS store as soon as it finishes.
+
+    remote=True retries rate limits and transient API errors with backoff;
+    local models fail fast. on_progress(done, total, chunks_per_sec) is
+    called from the calling thread after each batch lands in the index.
+    Returns the (possibly newly created) store, or the given one when
+    documents is empty.
+    """
+    if ids is None:
+        ids = [None] * len(documents)
+    batches = [
+        (documents[start:start + batch_size], ids[start:start + batch_size])
+        for start in range(0, len(documents), batch_size)
+    ]
+    total = len(documents)
+    done = 0
+    started = time.perf_counter()
+
+    def embed_batch(batch):
+        texts = [doc.page_content for doc in batch]
+        if remote:
+            return with_retries(lambda: embeddings.embed_documents(texts))
+        return embeddings.embed_documents(texts)
+
+    ## threads rather than processes: remote calls are I/O bound and local
+    ## sentence-transformers models release the GIL inside torch
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        ## each batch runs in a copy of the caller's context, so cache hits land on the current trace
+        futures = {pool.submit(copy_context().run, embed_batch, batch): (batch, batch_ids)
+                   for batch, batch_ids in batches}
+        for future in as_completed(futures):
+            batch, batch_ids = futures[future]
+            try:
+                vectors = future.result()
+            except Exception:
+                pool.shutdown(cancel_futures=True)
+                raise
+            text_embeddings = list(zip([doc.page_content for doc in batch], vectors))
+            metadatas = [doc.metadata for doc in batch]
+            batch_ids = None if batch_ids[0] is None else batch_ids
+            if vectorstore is None:
+                vectorstore = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=batch_ids)
+            else:
+                vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=batch_ids)
+            done += len(batch)
+            if on_progress is not None:
+                on_progress(done, total, done / max(time.perf_counter() - started, 1e-9))
+    return vectorstore
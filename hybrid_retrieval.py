@@ -0,0 +1,185 @@
+## hybrid BM25 + dense retrieval: keyword index, rank fusion, reranking and context packing
+import heapq
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+import tracing
+from response_cache import document_ids
+from tokens import estimate_tokens
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+HYBRID_K = int(os.getenv("RETRIEVAL_K", "4"))
+HYBRID_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "20"))
+CONTEXT_MAX_TOKENS = int(os.getenv("RETRIEVAL_CONTEXT_TOKENS", "1500"))
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+
+def bm25_tokenize(text):
+    """Lowercased words that keep model names and labels like "gpt-4" or "eq.3" whole"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of documents, with the postings built once up front"""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.documents = list(documents)
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_lengths = []
+        for index, doc in enumerate(self.documents):
+            tokens = bm25_tokenize(doc.page_content)
+            self.doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings.setdefault(term, []).append((index, tf))
+        count = len(self.documents)
+        self.avg_length = sum(self.doc_lengths) / count if count else 0.0
+        self.idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def search(self, query, k):
+        """Top k (document, score) pairs for query"""
+        scores = {}
+        for term in set(bm25_tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for index, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[index] / (self.avg_length or 1.0))
+                scores[index] = scores.get(index, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.documents[index], score) for index, score in best]
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=60):
+    """Fuse several best-first lists of document keys into one, by sum of 1 / (rrf_k + rank)"""
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class CrossEncoderReranker:
+    """Rerank (query, chunk) pairs with a local sentence-transformers cross-encoder, loaded on first use"""
+
+    def __init__(self, model_name=RERANKER_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def rerank(self, query, docs):
+        if not docs:
+            return docs
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name)
+        scores = self._model.predict([(query, doc.page_content) for doc in docs])
+        return [doc for _, doc in sorted(zip(scores, docs), key=lambda pair: pair[0], reverse=True)]
+
+
+def merge_overlapping(docs):
+    """
+    Merge chunks of the same page whose character ranges overlap (the
+    splitter's chunk_overlap), so the shared text is only sent once. Needs the
+    splitter's start_index metadata; other chunks pass through unchanged.
+    The merged chunk takes the position of its best ranked part.
+    """
+    groups, order = {}, []
+    for rank, doc in enumerate(docs):
+        start = doc.metadata.get("start_index")
+        if start is None:
+            order.append((rank, doc))
+            continue
+        groups.setdefault((doc.metadata.get("source"), doc.metadata.get("page")), []).append((start, rank, doc))
+
+    def merged(doc, text, start, ids):
+        metadata = {**doc.metadata, "start_index": start}
+        if len(ids) > 1:
+            metadata["chunk_id"] = "+".join(ids)
+        return Document(page_content=text, metadata=metadata)
+
+    for parts in groups.values():
+        parts.sort(key=lambda part: part[0])
+        start, rank, doc = parts[0]
+        text, end, ids = doc.page_content, start + len(doc.page_content), document_ids([doc])
+        for next_start, next_rank, next_doc in parts[1:]:
+            if next_start <= end:
+                text += next_doc.page_content[end - next_start:]
+                end = max(end, next_start + len(next_doc.page_content))
+                rank = min(rank, next_rank)
+                ids += document_ids([next_doc])
+            else:
+                order.append((rank, merged(doc, text, start, ids)))
+                start, rank, doc = next_start, next_rank, next_doc
+                text, end, ids = doc.page_content, start + len(doc.page_content), document_ids([doc])
+        order.append((rank, merged(doc, text, start, ids)))
+    return [doc for _, doc in sorted(order, key=lambda item: item[0])]
+
+
+def context_budget(k, base_tokens=CONTEXT_MAX_TOKENS, base_k=HYBRID_K, max_tokens=None):
+    """
+    Context token budget for k chunks: base_tokens scaled from base_k to k,
+    so raising k also makes room for the extra chunks; at most max_tokens.
+    """
+    budget = max(base_tokens, base_tokens * k // max(base_k, 1))
+    return min(budget, max_tokens) if max_tokens else budget
+
+
+def pack_context(docs, max_tokens=CONTEXT_MAX_TOKENS, max_docs=HYBRID_K):
+    """Best-first chunks up to max_docs that fit max_tokens; the top chunk is always kept"""
+    packed, used = [], 0
+    for doc in docs:
+        if len(packed) >= max_docs:
+            break
+        tokens = estimate_tokens(doc.page_content)
+        if packed and used + tokens > max_tokens:
+            continue
+        packed.append(doc)
+        used += tokens
+    return packed
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense FAISS search fused with BM25 keyword search by reciprocal rank
+    fusion, optionally reranked by a cross-encoder. Overlapping chunks are
+    merged and the result is packed into a token budget, so the prompt gets
+    a few good chunks rather than every hit.
+    """
+
+    vectorstore: Any
+    bm25: Any
+    reranker: Any = None
+    k: int = HYBRID_K
+    fetch_k: int = HYBRID_FETCH_K
+    max_context_tokens: int = CONTEXT_MAX_TOKENS
+    rrf_k: int = 60
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        with tracing.stage("faiss_search"):
+            dense = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        with tracing.stage("bm25_search"):
+            sparse = [doc for doc, _ in self.bm25.search(query, self.fetch_k)]
+        by_key = {}
+        rankings = []
+        for hits in (dense, sparse):
+            keys = document_ids(hits)
+            by_key.update(zip(keys, hits))
+            rankings.append(keys)
+        candidates = [by_key[key] for key in reciprocal_rank_fusion(rankings, self.rrf_k)][:self.fetch_k]
+        if self.reranker is not None:
+            with tracing.stage("rerank", documents=len(candidates)):
+                candidates = self.reranker.rerank(query, candidates)
+        return pack_context(merge_overlapping(candidates), self.max_context_tokens, self.k)
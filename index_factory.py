@@ -0,0 +1,237 @@
+"""
+FAISS index types for corpora that outgrow an exact flat index.
+
+    python index_factory.py --sizes 10000,100000 --dim 1536
+    python index_factory.py --from-index faiss_index/<settings>/<generation>
+
+Builds every index type on the same vectors and prints, as JSON, recall@k
+against the exact flat baseline, per-query latency, build time and index
+size, so FAISS_INDEX_TYPE / FAISS_NPROBE / FAISS_HNSW_EF_SEARCH can be picked
+per corpus size.
+"""
+import argparse
+import json
+import os
+import pickle
+import time
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+## flat: exact, float32 | sq8: exact scan over 8-bit codes, 4x smaller
+## ivfpq: inverted lists + product quantization, trained | hnsw: graph over float32 vectors
+INDEX_TYPES = ("flat", "sq8", "ivfpq", "hnsw")
+INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+IVF_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", "100000"))
+## below this IVF-PQ cannot train 256 centroids per sub-quantizer and flat is fast anyway
+IVFPQ_MIN_VECTORS = int(os.getenv("FAISS_IVFPQ_MIN_VECTORS", "10000"))
+MMAP = os.getenv("FAISS_MMAP", "") not in ("", "0")
+
+INDEX_CLASSES = {
+    "IndexFlat": "flat",
+    "IndexFlatL2": "flat",
+    "IndexScalarQuantizer": "sq8",
+    "IndexIVFPQ": "ivfpq",
+    "IndexHNSWFlat": "hnsw",
+}
+## types whose stored vectors can be read back exactly
+EXACT_TYPES = ("flat", "hnsw")
+
+
+def index_type_of(index):
+    """One of INDEX_TYPES for a faiss index, or None for anything else"""
+    return INDEX_CLASSES.get(type(index).__name__)
+
+
+def pq_subquantizers(dim):
+    """Largest PQ code size that splits dim into sub-vectors of at least 8 dimensions"""
+    for m in range(max(dim // 8, 1), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def index_spec(index_type, dim, count):
+    """faiss.index_factory string for index_type at this corpus size"""
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "sq8":
+        return "SQ8"
+    if index_type == "hnsw":
+        return f"HNSW{HNSW_M}"
+    if index_type == "ivfpq":
+        if count < IVFPQ_MIN_VECTORS:
+            return "Flat"
+        ## ~4 sqrt(n) lists, keeping at least 39 training points per list
+        nlist = max(1, min(int(4 * count ** 0.5), count // 39))
+        return f"IVF{nlist},PQ{pq_subquantizers(dim)}"
+    raise ValueError(f"Unknown index type {index_type!r}, expected one of {', '.join(INDEX_TYPES)}")
+
+
+def tune_index(index, nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH):
+    """Apply the query-time recall/speed knobs"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    return index
+
+
+def build_index(vectors, spec, train_sample=TRAIN_SAMPLE, seed=0):
+    """New L2 index from spec, trained on a random sample of at most train_sample rows and filled with vectors"""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    index = faiss.index_factory(vectors.shape[1], spec, faiss.METRIC_L2)
+    if not index.is_trained:
+        sample = vectors
+        if len(vectors) > train_sample:
+            rng = np.random.default_rng(seed)
+            sample = vectors[rng.choice(len(vectors), train_sample, replace=False)]
+        index.train(sample)
+    index.add(vectors)
+    return tune_index(index)
+
+
+def index_vectors(index):
+    """Every stored vector of an exact (flat or HNSW) index, in position order"""
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def apply_index_type(store, index_type=INDEX_TYPE):
+    """
+    Move a LangChain FAISS store onto index_type in place. Only exact indexes
+    are converted, so vectors are never quantized twice; a store too small to
+    train IVF-PQ stays flat until it grows.
+    """
+    current = index_type_of(store.index)
+    spec = index_spec(index_type, store.index.d, store.index.ntotal)
+    if current == index_type or current not in EXACT_TYPES or (spec == "Flat" and current == "flat"):
+        return store
+    store.index = build_index(index_vectors(store.index), spec)
+    return store
+
+
+def prepare_for_delete(store):
+    """
+    Make FAISS.delete safe on store. HNSW cannot remove vectors, so it is
+    swapped for an exact flat copy that apply_index_type rebuilds later.
+    IVF keeps its labels on removal while FAISS.delete renumbers them, so
+    None is returned and the caller rebuilds from the surviving chunks.
+    """
+    kind = index_type_of(store.index)
+    if kind == "hnsw":
+        flat = faiss.IndexFlatL2(store.index.d)
+        flat.add(index_vectors(store.index))
+        store.index = flat
+    elif kind == "ivfpq":
+        return None
+    return store
+
+
+def load_store(path, embeddings, mmap=MMAP):
+    """
+    FAISS.load_local that can memory-map the index, so IVF lists are paged in
+    from disk on demand instead of read up front. A mapped index is read-only.
+    """
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    index = tune_index(faiss.read_index(os.path.join(path, "index.faiss"), flags))
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def synthetic_vectors(count, dim, clusters=64, seed=0):
+    """Clustered gaussian vectors, a rough stand-in for text embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype("float32")
+    points = centers[rng.integers(clusters, size=count)] + 0.5 * rng.normal(size=(count, dim)).astype("float32")
+    return np.ascontiguousarray(points, dtype="float32")
+
+
+def _search_stats(index, queries, truth, k):
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        _, found = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - started)
+        hits += len(set(found[0]) & set(expected))
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "recall_at_k": round(hits / (len(queries) * k), 4),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+    }
+
+
+def recall_latency_report(vectors, index_types=INDEX_TYPES, query_count=200, k=10,
+                          nprobes=(IVF_NPROBE,), ef_searches=(HNSW_EF_SEARCH,), seed=0):
+    """One row per index type and search setting, measured against the exact flat baseline"""
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.choice(len(vectors), min(query_count, len(vectors)), replace=False)]
+    queries = np.ascontiguousarray(picked + 0.1 * rng.normal(size=picked.shape), dtype="float32")
+    baseline = faiss.IndexFlatL2(vectors.shape[1])
+    baseline.add(vectors)
+    _, truth = baseline.search(queries, k)
+
+    rows = []
+    for index_type in index_types:
+        spec = index_spec(index_type, vectors.shape[1], len(vectors))
+        started = time.perf_counter()
+        index = build_index(vectors, spec)
+        build_seconds = time.perf_counter() - started
+        row = {
+            "vectors": len(vectors),
+            "dim": vectors.shape[1],
+            "index_type": index_type,
+            "spec": spec,
+            "build_seconds": round(build_seconds, 3),
+            "size_mb": round(faiss.serialize_index(index).nbytes / 2 ** 20, 2),
+        }
+        if faiss.try_extract_index_ivf(index) is not None:
+            settings = [{"nprobe": n} for n in nprobes]
+        elif hasattr(index, "hnsw"):
+            settings = [{"ef_search": ef} for ef in ef_searches]
+        else:
+            settings = [{}]
+        for setting in settings:
+            tune_index(index, setting.get("nprobe", IVF_NPROBE), setting.get("ef_search", HNSW_EF_SEARCH))
+            rows.append({**row, **setting, **_search_stats(index, queries, truth, k)})
+    return rows
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recall vs latency of the FAISS index types")
+    parser.add_argument("--from-index", help="persisted index directory to take the vectors from (flat or hnsw)")
+    parser.add_argument("--sizes", type=_int_list, default=[10000, 100000], help="synthetic corpus sizes")
+    parser.add_argument("--dim", type=int, default=1536, help="synthetic vector dimension")
+    parser.add_argument("--types", default=",".join(INDEX_TYPES), help="index types to compare")
+    parser.add_argument("--queries", type=int, default=200, help="queries per index")
+    parser.add_argument("--k", type=int, default=10, help="neighbours per query")
+    parser.add_argument("--nprobe", type=_int_list, default=[4, 16, 64], help="IVF lists probed per query")
+    parser.add_argument("--ef-search", type=_int_list, default=[32, 64, 128], help="HNSW search breadth")
+    args = parser.parse_args(argv)
+
+    if args.from_index:
+        index = faiss.read_index(os.path.join(args.from_index, "index.faiss"))
+        if index_type_of(index) not in EXACT_TYPES:
+            parser.error(f"{args.from_index} holds a quantized index; its original vectors are gone")
+        corpora = [index_vectors(index)]
+    else:
+        corpora = [synthetic_vectors(size, args.dim) for size in args.sizes]
+
+    index_types = [t for t in args.types.split(",") if t]
+    for vectors in corpora:
+        for row in recall_latency_report(vectors, index_types, args.queries, args.k, args.nprobe, args.ef_search):
+            print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
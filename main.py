@@ -1,15 +1,13 @@
 import streamlit as st
 import os
-from langchain_groq import ChatGroq
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
-from langchain.chains import create_retrieval_chain
-from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import PyPDFDirectoryLoader
-import openai
+from rag_chains import research_prompt
+from models import (RESEARCH_PAPERS_DIR,RESEARCH_QA_MODEL,groq_llm,load_research_index,research_embeddings,
+                    research_index_settings)
+from response_cache import ResponseCache,document_ids,llm_identity
+from hybrid_retrieval import HYBRID_K,BM25Index,CrossEncoderReranker,HybridRetriever,context_budget
+from splitting import LLM_CONTEXT_TOKENS,RESERVED_CONTEXT_TOKENS
+from tokens import estimate_tokens
+from tracing import callbacks_config,show_trace_panel,start_metrics_server,tracer
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -18,48 +16,103 @@ os.environ['OPENAI_API_KEY']=os.getenv("OPENAI_API_KEY")
 os.environ['GROQ_API_KEY']=os.getenv("GROQ_API_KEY")
 
 groq_api_key=os.getenv("GROQ_API_KEY")
-
-llm=ChatGroq(groq_api_key=groq_api_key,model_name="Llama3-8b-8192")
-
-prompt=ChatPromptTemplate.from_template(
-    """
-    Answer the questions based on the provided context only.
-    Please provide the most accurate respone based on the question
-    <context>
-    {context}
-    <context>
-    Question:{input}
-
-    """
-
-)
+start_metrics_server() ## no-op unless TRACE_METRICS_PORT is set
+
+prompt=research_prompt
+## most retrieved context the model can take next to the prompt and the answer
+MAX_CONTEXT_TOKENS=LLM_CONTEXT_TOKENS.get(RESEARCH_QA_MODEL.lower(),8192)-RESERVED_CONTEXT_TOKENS
+
+## models and chains are built on first use and shared by every session of the process,
+## so reruns and new visitors skip their construction (and the first page skips the imports)
+@st.cache_resource
+def get_llm():
+    return groq_llm(RESEARCH_QA_MODEL,groq_api_key)
+
+@st.cache_resource
+def get_embeddings():
+    return research_embeddings()
+
+@st.cache_resource
+def get_document_chain():
+    from langchain.chains.combine_documents import create_stuff_documents_chain ## slow import, first question only
+    return create_stuff_documents_chain(get_llm(),prompt)
+
+## one index per process, shared by every browser session; the fingerprint
+## argument makes streamlit hand out a new index once the corpus changes.
+## SPLITTER_MODE=tokens sizes chunks for the embedding model and the context budget
+@st.cache_resource(show_spinner="Loading vector database...",max_entries=1)
+def load_vector_store(fingerprint):
+    progress=st.progress(0.0,text="Embedding new or changed documents...")
+    def show_progress(done,total,rate):
+        progress.progress(done/total,text=f"Embedded {done}/{total} chunks ({rate:.1f} chunks/sec)")
+    vectors=load_research_index(get_embeddings(),get_llm(),remote=True,on_progress=show_progress)
+    progress.empty()
+    return vectors
+
+## keyword index over the same chunks, built once per index generation
+@st.cache_resource(show_spinner="Building keyword index...",max_entries=1)
+def load_bm25_index(fingerprint,_vectors):
+    return BM25Index(_vectors.docstore._dict.values())
+
+@st.cache_resource
+def get_reranker():
+    return CrossEncoderReranker()
+
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(embeddings=get_embeddings())
 
 def create_vector_embedding():
     if "vectors" not in st.session_state:
-        st.session_state.embeddings=OpenAIEmbeddings()
-        st.session_state.loader=PyPDFDirectoryLoader("research_papers") ## Data Ingestion step
-        st.session_state.docs=st.session_state.loader.load() ## Document Loading
-        st.session_state.text_splitter=RecursiveCharacterTextSplitter(chunk_size=1000,chunk_overlap=200)
-        st.session_state.final_documents=st.session_state.text_splitter.split_documents(st.session_state.docs[:50])
-        st.session_state.vectors=FAISS.from_documents(st.session_state.final_documents,st.session_state.embeddings)
+        from vector_store import corpus_fingerprint
+        settings=research_index_settings(get_embeddings(),get_llm())
+        fingerprint=corpus_fingerprint(RESEARCH_PAPERS_DIR,settings)
+        with tracer.trace("research_qa","index"):
+            vectors=load_vector_store(fingerprint)
+        if vectors is None:
+            st.error(f"No PDF files found in {RESEARCH_PAPERS_DIR}")
+            st.stop()
+        st.session_state.vectors=vectors
+        st.session_state.index_fingerprint=fingerprint
 st.title("RAG Document Q&A With Groq And Lama3")
 
 user_prompt=st.text_input("Enter your query from the research paper")
 
+retrieval_k=st.sidebar.slider("Chunks per answer",min_value=1,max_value=10,value=HYBRID_K)
+## the budget grows with k by default; chunks that do not fit it are dropped
+context_tokens=st.sidebar.number_input("Context token budget",min_value=256,max_value=MAX_CONTEXT_TOKENS,
+                                       value=context_budget(retrieval_k,max_tokens=MAX_CONTEXT_TOKENS),step=256)
+use_reranker=st.sidebar.checkbox("Rerank with a local cross-encoder",value=False)
+
 if st.button("Document Embedding"):
+    st.session_state.pop("vectors",None) ## pick up added, changed or removed PDFs
     create_vector_embedding()
     st.write("Vector Database is ready")
 
-import time
-
 if user_prompt:
-    document_chain=create_stuff_documents_chain(llm,prompt)
-    retriever=st.session_state.vectors.as_retriever()
-    retrieval_chain=create_retrieval_chain(retriever,document_chain)
-
-    start=time.process_time()
-    response=retrieval_chain.invoke({'input':user_prompt})
-    print(f"Response time :{time.process_time()-start}")
+    llm=get_llm()
+    document_chain=get_document_chain()
+    ## dense + BM25 hits fused, deduplicated and packed into a token budget
+    retriever=HybridRetriever(vectorstore=st.session_state.vectors,
+                              bm25=load_bm25_index(st.session_state.index_fingerprint,st.session_state.vectors),
+                              reranker=get_reranker() if use_reranker else None,
+                              k=retrieval_k,max_context_tokens=context_tokens)
+    response_cache=get_response_cache()
+
+    with tracer.trace("research_qa","query") as trace:
+        ## retrieve first so the cache key covers the exact chunks the answer is based on
+        context=retriever.invoke(user_prompt,config=callbacks_config(trace))
+        chunk_ids=document_ids(context)
+        answer=response_cache.get_or_compute(
+            (*llm_identity(llm),prompt.pretty_repr(),user_prompt,chunk_ids),
+            lambda:document_chain.invoke({'input':user_prompt,'context':context},config=callbacks_config(trace)),
+            query_text=user_prompt,scope=(*llm_identity(llm),*chunk_ids))
+    st.session_state.last_trace=trace.as_dict()
+    response={'answer':answer,'context':context}
+    packed_tokens=sum(estimate_tokens(doc.page_content) for doc in context)
+    st.sidebar.caption(f"Packed {len(context)} of {retrieval_k} chunks ({packed_tokens}/{context_tokens} tokens)")
+    print(f"Response time :{trace.seconds}")
+    st.sidebar.caption(f"Response cache: {response_cache.stats()}")
 
     st.write(response['answer'])
 
@@ -69,6 +122,8 @@ if user_prompt:
             st.write(doc.page_content)
             st.write('------------------------')
 
+show_trace_panel(st.session_state.get("last_trace"))
+
 
 
 
@@ -0,0 +1,46 @@
+## model and index constructors shared by the apps, api.py and warmup.py; the heavy
+## libraries behind them (torch, sentence-transformers, faiss, langchain chains) are
+## imported on first call, not when the app starts
+import os
+
+from embedding_cache import CachedEmbeddings
+from splitting import SPLITTER_MODE, chunk_sizes
+
+RESEARCH_PAPERS_DIR = os.getenv("RESEARCH_PAPERS_DIR", "research_papers")
+RESEARCH_QA_MODEL = "Llama3-8b-8192"
+RESEARCH_CHUNKING_CHARS = (1000, 200)
+UPLOAD_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+
+def groq_llm(model_name, api_key=None):
+    from langchain_groq import ChatGroq
+    return ChatGroq(groq_api_key=api_key or os.getenv("GROQ_API_KEY"), model_name=model_name)
+
+
+def research_embeddings():
+    """OpenAI embeddings of the research-paper index, behind the local cache"""
+    from langchain_openai import OpenAIEmbeddings
+    return CachedEmbeddings(OpenAIEmbeddings())
+
+
+def upload_embeddings():
+    """Local sentence-transformers model of the upload app; loads torch and the weights"""
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return CachedEmbeddings(HuggingFaceEmbeddings(model_name=UPLOAD_EMBEDDING_MODEL))
+
+
+def research_chunking(embeddings, llm):
+    """(chunk_size, chunk_overlap) of the research-paper index for SPLITTER_MODE"""
+    return chunk_sizes(SPLITTER_MODE, embeddings, llm, chars=RESEARCH_CHUNKING_CHARS)
+
+
+def research_index_settings(embeddings, llm):
+    from vector_store import index_settings
+    return index_settings(embeddings, *research_chunking(embeddings, llm), splitter_mode=SPLITTER_MODE)
+
+
+def load_research_index(embeddings, llm, pdf_dir=RESEARCH_PAPERS_DIR, **options):
+    """load_or_build_index with the same settings everywhere, so every entry point shares one persisted index"""
+    from vector_store import load_or_build_index
+    chunk_size, chunk_overlap = research_chunking(embeddings, llm)
+    return load_or_build_index(pdf_dir, embeddings, chunk_size, chunk_overlap, splitter_mode=SPLITTER_MODE, **options)
@@ -0,0 +1,104 @@
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_core.documents import Document
+
+PDF_BACKENDS = ("pypdf", "pymupdf")
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "50"))
+## uploads with fewer pages than this in total are parsed inline; below it the
+## worker round trip costs more than the parsing itself
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "200"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0")) or os.cpu_count() or 1
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """One worker pool per process, started on the first large upload and reused after that"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            ## spawn, not fork: the caller may be a threaded server with torch already loaded
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _open(source, backend):
+    """source is a path or the PDF bytes"""
+    if backend == "pymupdf":
+        import pymupdf
+        if isinstance(source, bytes):
+            return pymupdf.open(stream=source, filetype="pdf")
+        return pymupdf.open(source)
+    import pypdf
+    return pypdf.PdfReader(io.BytesIO(source) if isinstance(source, bytes) else source)
+
+
+def page_count(source, backend="pypdf"):
+    pdf = _open(source, backend)
+    return pdf.page_count if backend == "pymupdf" else len(pdf.pages)
+
+
+def _parse_range(source, backend, start, stop):
+    """Extract the text of pages [start, stop); workers get a path so the bytes are not pickled per range"""
+    started = time.perf_counter()
+    pdf = _open(source, backend)
+    if backend == "pymupdf":
+        texts = [pdf[i].get_text() for i in range(start, stop)]
+    else:
+        texts = [pdf.pages[i].extract_text() or "" for i in range(start, stop)]
+    return start, texts, time.perf_counter() - started
+
+
+def parse_pdfs(files, backend="pypdf", pages_per_task=PAGES_PER_TASK, parallel_min_pages=PARALLEL_MIN_PAGES):
+    """
+    Parse in-memory PDFs into one Document per page.
+
+    files is a list of (name, bytes). Uploads of at least parallel_min_pages
+    pages are parsed by the shared worker pool, one task per file or per
+    pages_per_task slice of a long file; each file is written to a scratch
+    file once and workers open it by path. Smaller uploads are parsed
+    inline. Returns the documents in file and page order plus per-file
+    stats ({"name", "pages", "seconds"}).
+    """
+    if backend not in PDF_BACKENDS:
+        raise ValueError(f"Unknown PDF backend {backend!r}, expected one of {PDF_BACKENDS}")
+
+    ranges = []
+    for index, (name, data) in enumerate(files):
+        pages = page_count(data, backend)
+        for start in range(0, pages, pages_per_task):
+            ranges.append((index, start, min(start + pages_per_task, pages)))
+    total_pages = sum(stop - start for _, start, stop in ranges)
+
+    if len(ranges) > 1 and total_pages >= parallel_min_pages:
+        with tempfile.TemporaryDirectory(prefix="pdf-upload-") as scratch:
+            paths = []
+            for index, (_, data) in enumerate(files):
+                path = os.path.join(scratch, f"{index}.pdf")
+                with open(path, "wb") as f:
+                    f.write(data)
+                paths.append(path)
+            pool = _get_pool()
+            futures = [pool.submit(_parse_range, paths[index], backend, start, stop) for index, start, stop in ranges]
+            results = [future.result() for future in futures]
+    else:
+        results = [_parse_range(files[index][1], backend, start, stop) for index, start, stop in ranges]
+
+    pages_by_file = [[] for _ in files]
+    stats = [{"name": name, "pages": 0, "seconds": 0.0} for name, _ in files]
+    for (index, _, _), (start, texts, seconds) in zip(ranges, results):
+        name = files[index][0]
+        for offset, text in enumerate(texts):
+            pages_by_file[index].append(Document(page_content=text, metadata={"source": name, "page": start + offset}))
+        stats[index]["pages"] += len(texts)
+        stats[index]["seconds"] += seconds
+
+    documents = [doc for pages in pages_by_file for doc in pages]
+    return documents, stats
@@ -0,0 +1,99 @@
+## prompts and chain wiring shared by the Streamlit apps and api.py
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableLambda
+from langchain_core.runnables.history import RunnableWithMessageHistory
+
+from response_cache import document_ids, llm_identity
+from retrievers import create_fast_history_aware_retriever
+
+## research paper Q&A (main.py)
+research_prompt = ChatPromptTemplate.from_template(
+    """
+    Answer the questions based on the provided context only.
+    Please provide the most accurate respone based on the question
+    <context>
+    {context}
+    <context>
+    Question:{input}
+
+    """
+
+)
+
+## conversational RAG (RAG_QA_app.py)
+contextualize_q_system_prompt = (
+    "Given a chat history and the latest user question "
+    "which might reference context in the chat history, "
+    "formulate a standalone question which can be understood "
+    "without the chat history. Do NOT answer the question, "
+    "just reformulate it if needed and otherwise return it as is."
+)
+contextualize_q_prompt = ChatPromptTemplate.from_messages([
+    ("system", contextualize_q_system_prompt),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+])
+
+system_prompt = (
+    "You are an assistant for question-answering tasks. "
+    "Use the following pieces of retrieved context to answer "
+    "the question. If you don't know the answer, say that you "
+    "don't know. Use three sentences maximum and keep the "
+    "answer concise."
+    "\n\n"
+    "{context}"
+)
+qa_prompt = ChatPromptTemplate.from_messages([
+    ("system", system_prompt),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+])
+
+
+def create_conversational_rag_chain(llm, retriever, get_session_history, response_cache=None):
+    """
+    History-aware retrieval chain wrapped in RunnableWithMessageHistory.
+
+    With a response_cache, identical (history, question, retrieved chunks)
+    are answered from the cache; leave it out when the answer should be
+    streamed token by token.
+    """
+    ## importing langchain.chains is slow; main.py only needs the prompt at start-up
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+    from langchain.chains.retrieval import create_retrieval_chain
+
+    ## only pays for the question rewrite when the question leans on earlier turns
+    history_aware_retriever = create_fast_history_aware_retriever(llm, retriever, contextualize_q_prompt)
+
+    ## answer question
+    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
+    if response_cache is not None:
+        uncached_chain = question_answer_chain
+
+        def cache_args(inputs):
+            history = [(m.type, str(m.content)) for m in inputs["chat_history"]]
+            chunk_ids = document_ids(inputs["context"])
+            return {
+                "key_parts": (*llm_identity(llm), qa_prompt.pretty_repr(), history, inputs["input"], chunk_ids),
+                "query_text": inputs["input"],
+                "scope": (*llm_identity(llm), *map(str, history), *chunk_ids),
+            }
+
+        def answer_with_cache(inputs, config):
+            return response_cache.get_or_compute(compute=lambda: uncached_chain.invoke(inputs, config),
+                                                 **cache_args(inputs))
+
+        async def aanswer_with_cache(inputs, config):
+            return await response_cache.aget_or_compute(acompute=lambda: uncached_chain.ainvoke(inputs, config),
+                                                        **cache_args(inputs))
+
+        ## afunc keeps ainvoke/astream on the async LLM client instead of a thread-pool worker
+        question_answer_chain = RunnableLambda(answer_with_cache, afunc=aanswer_with_cache)
+    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+
+    return RunnableWithMessageHistory(
+        rag_chain, get_session_history,
+        input_messages_key="input",
+        history_messages_key="chat_history",
+        output_messages_key="answer",
+    )
@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import tracing
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+## cosine threshold for the similarity layer; unset keeps it off
+RESPONSE_CACHE_SIMILARITY = os.getenv("RESPONSE_CACHE_SIMILARITY")
+
+logger = logging.getLogger(__name__)
+
+
+def llm_identity(llm):
+    """(model, temperature) of a LangChain chat model, for cache keys"""
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", None)
+    return model, getattr(llm, "temperature", None)
+
+
+def document_ids(docs):
+    """Stable IDs of retrieved chunks: the ingestion chunk_id, else a content hash"""
+    return [
+        doc.metadata.get("chunk_id") or hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()[:16]
+        for doc in docs
+    ]
+
+
+class ResponseCache:
+    """
+    LLM response cache with an exact layer and an opt-in similarity layer.
+
+    The exact layer is keyed by a hash of whatever identifies the call,
+    typically (model, temperature, prompt, retrieved chunk IDs). When
+    embeddings and a similarity_threshold are given, a miss falls back to
+    the cached entry in the same scope whose query embedding has the highest
+    cosine similarity, if it clears the threshold. Entries expire after
+    ttl_seconds and the least recently used are evicted past max_entries.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+                 embeddings=None, similarity_threshold=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embeddings = embeddings
+        if similarity_threshold is None and RESPONSE_CACHE_SIMILARITY:
+            similarity_threshold = float(RESPONSE_CACHE_SIMILARITY)
+        self.similarity_threshold = similarity_threshold
+        if similarity_threshold is not None and embeddings is None:
+            logger.warning("Response cache similarity threshold %s ignored: no embeddings given, exact matches only",
+                           similarity_threshold)
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  ## key -> (value, expires_at, scope, unit query vector or None)
+        self._lock = threading.Lock()
+
+    @property
+    def semantic(self):
+        return self.embeddings is not None and self.similarity_threshold is not None
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _embed(self, query_text):
+        vector = np.asarray(self.embeddings.embed_query(query_text), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _expire(self, now):
+        for key in [k for k, entry in self._entries.items() if entry[1] < now]:
+            del self._entries[key]
+
+    def get(self, key, query_text=None, scope=None):
+        """Cached value for key, else for the most similar query in scope, else None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] >= now:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                tracing.count("response_cache.hit")
+                return entry[0]
+        if self.semantic and query_text:
+            vector = self._embed(query_text)
+            with self._lock:
+                self._expire(now)
+                candidates = [(k, e) for k, e in self._entries.items() if e[2] == scope and e[3] is not None]
+                if candidates:
+                    scores = np.stack([e[3] for _, e in candidates]) @ vector
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.similarity_threshold:
+                        best_key, best_entry = candidates[best]
+                        self._entries.move_to_end(best_key)
+                        self.similar_hits += 1
+                        tracing.count("response_cache.similar_hit")
+                        return best_entry[0]
+        with self._lock:
+            self.misses += 1
+        tracing.count("response_cache.miss")
+        return None
+
+    def put(self, key, value, query_text=None, scope=None):
+        vector = self._embed(query_text) if self.semantic and query_text else None
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl_seconds, scope, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key_parts, compute, query_text=None, scope=None):
+        """Return the cached response for key_parts, calling compute() and caching its result on a miss"""
+        key = self.make_key(*key_parts)
+        value = self.get(key, query_text, scope)
+        if value is None:
+            value = compute()
+            self.put(key, value, query_text, scope)
+        return value
+
+    async def aget_or_compute(self, key_parts, acompute, query_text=None, scope=None):
+        """get_or_compute for async callers; acompute() returns an awaitable"""
+        key = self.make_key(*key_parts)
+        ## the similarity layer may call the embedding API, keep it off the event loop
+        value = await asyncio.to_thread(self.get, key, query_text, scope)
+        if value is None:
+            value = await acompute()
+            await asyncio.to_thread(self.put, key, value, query_text, scope)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.similar_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+            }
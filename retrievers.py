@@ -0,0 +1,81 @@
+import re
+import threading
+from collections import OrderedDict
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
+
+## words that usually point back at an earlier turn ("what about its accuracy?")
+REFERENCE_WORDS = re.compile(
+    r"\b(it|its|it's|they|them|their|theirs|this|that|these|those|he|him|his|she|her|hers|"
+    r"former|latter|above|previous|previously|earlier|same|such|again|else|instead|one|ones)\b",
+    re.IGNORECASE,
+)
+FOLLOW_UP_OPENERS = re.compile(r"^\s*(and|but|also|so|then|what about|how about|why|why not|more)\b", re.IGNORECASE)
+
+
+def is_standalone(question):
+    """Cheap check that a question can be understood without the chat history"""
+    if len(question.split()) < 4:
+        return False
+    if FOLLOW_UP_OPENERS.search(question):
+        return False
+    return not REFERENCE_WORDS.search(question)
+
+
+def create_fast_history_aware_retriever(llm, retriever, prompt, history_turns=6, cache_size=256):
+    """
+    Drop-in replacement for create_history_aware_retriever that only asks the
+    LLM to rewrite the question when it actually depends on the history.
+
+    The rewrite is skipped when there is no chat history or is_standalone()
+    says the question stands alone. Otherwise only the last history_turns
+    messages are sent, and rewrites are memoized per (recent history,
+    question) so repeats cost no LLM call.
+    """
+    rewrite_chain = prompt | llm | StrOutputParser()
+    rewrites = OrderedDict()
+    lock = threading.Lock()
+
+    def prepare(inputs):
+        """(rewrite inputs, memo key), or (None, None) when the question stands alone"""
+        question = inputs["input"]
+        history = list(inputs.get("chat_history") or [])[-history_turns:]
+        if not history or is_standalone(question):
+            return None, None
+        return {**inputs, "chat_history": history}, (tuple((m.type, str(m.content)) for m in history), question)
+
+    def recall(key):
+        with lock:
+            if key in rewrites:
+                rewrites.move_to_end(key)
+                return rewrites[key]
+        return None
+
+    def remember(key, rewritten):
+        with lock:
+            rewrites[key] = rewritten
+            while len(rewrites) > cache_size:
+                rewrites.popitem(last=False)
+        return rewritten
+
+    def rewrite_question(inputs, config):
+        rewrite_inputs, key = prepare(inputs)
+        if key is None:
+            return inputs["input"]
+        rewritten = recall(key)
+        if rewritten is None:
+            rewritten = remember(key, rewrite_chain.invoke(rewrite_inputs, config))
+        return rewritten
+
+    async def arewrite_question(inputs, config):
+        rewrite_inputs, key = prepare(inputs)
+        if key is None:
+            return inputs["input"]
+        rewritten = recall(key)
+        if rewritten is None:
+            rewritten = remember(key, await rewrite_chain.ainvoke(rewrite_inputs, config))
+        return rewritten
+
+    rewrite = RunnableLambda(rewrite_question, afunc=arewrite_question)
+    return (rewrite | retriever).with_config(run_name="fast_history_aware_retriever")
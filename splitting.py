@@ -0,0 +1,113 @@
+import os
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from hybrid_retrieval import CONTEXT_MAX_TOKENS, HYBRID_K
+from tokens import estimate_tokens
+
+## "chars" keeps the apps' character-sized chunks, "tokens" sizes chunks in tokens
+SPLITTER_MODE = os.getenv("SPLITTER_MODE", "chars")
+CHUNK_OVERLAP_RATIO = float(os.getenv("CHUNK_OVERLAP_RATIO", "0.1"))
+## room kept free in the LLM context for the system prompt, question, history and answer
+RESERVED_CONTEXT_TOKENS = int(os.getenv("RESERVED_CONTEXT_TOKENS", "1500"))
+
+## max input length of the embedding models in use, in the model's own tokens
+EMBEDDING_MAX_TOKENS = {
+    "text-embedding-ada-002": 8191,
+    "text-embedding-3-small": 8191,
+    "text-embedding-3-large": 8191,
+    "all-MiniLM-L6-v2": 256,
+    "sentence-transformers/all-MiniLM-L6-v2": 256,
+}
+LLM_CONTEXT_TOKENS = {
+    "llama3-8b-8192": 8192,
+    "gemma2-9b-it": 8192,
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+}
+## estimate_tokens counts cl100k tokens; WordPiece and other tokenizers usually need more
+FOREIGN_TOKENIZER_MARGIN = 0.8
+
+## paper structure first: numbered or well-known section headings, then paragraphs, lines, sentences, words
+SECTION_SEPARATORS = [
+    r"\n(?=(?:\d+(?:\.\d+)*\.?|[IVX]+\.)\s+[A-Z][^\n]{0,80}\n)",
+    r"\n(?=(?:Abstract|Introduction|Related Work|Background|Method|Methods|Experiments|Results|"
+    r"Discussion|Conclusions?|References|Acknowledg(?:e)?ments|Appendix)\b)",
+    r"\n\n",
+    r"\n",
+    r"(?<=[.!?])\s+",
+    r" ",
+    r"",
+]
+
+
+def embedding_max_tokens(embeddings, default=512):
+    """Longest input the embedding model reads, in estimate_tokens units"""
+    embeddings = getattr(embeddings, "underlying", embeddings)  ## look through CachedEmbeddings
+    model = getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None) or ""
+    if model in EMBEDDING_MAX_TOKENS:
+        limit = EMBEDDING_MAX_TOKENS[model]
+    else:
+        ## sentence-transformers models carry their own limit
+        limit = getattr(getattr(embeddings, "client", None), "max_seq_length", None) or default
+    if not model.startswith("text-embedding-"):
+        limit = int(limit * FOREIGN_TOKENIZER_MARGIN)
+    return limit
+
+
+def llm_context_tokens(llm, default=8192):
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", None) or ""
+    return LLM_CONTEXT_TOKENS.get(model.lower(), default)
+
+
+def token_chunk_size(embedding_max, context_tokens, k=HYBRID_K, reserved_tokens=RESERVED_CONTEXT_TOKENS,
+                     context_cap=CONTEXT_MAX_TOKENS):
+    """
+    Largest chunk the embedding model reads whole and of which k still fit
+    in the retrieved-context budget: the LLM context minus reserved_tokens,
+    capped at context_cap (the retriever's packing budget).
+    """
+    budget = max(context_tokens - reserved_tokens, 0)
+    if context_cap:
+        budget = min(budget, context_cap)
+    return max(32, min(embedding_max, budget // max(k, 1)))
+
+
+def chunk_sizes(mode, embeddings, llm, chars, k=HYBRID_K, overlap_ratio=CHUNK_OVERLAP_RATIO):
+    """(chunk_size, chunk_overlap) for mode: chars as given, or tokens sized for the models in use"""
+    if mode == "chars":
+        return chars
+    if mode != "tokens":
+        raise ValueError(f"Unknown splitter mode {mode!r}, expected 'chars' or 'tokens'")
+    size = token_chunk_size(embedding_max_tokens(embeddings), llm_context_tokens(llm), k)
+    return size, int(size * overlap_ratio)
+
+
+def make_splitter(mode, chunk_size, chunk_overlap, add_start_index=False):
+    """
+    Character splitter as before, or a token-sized one that prefers to cut at
+    section headings and paragraph ends. Either way split_documents() never
+    lets a chunk cross a page, since every page is its own Document.
+    """
+    if mode == "chars":
+        return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                              add_start_index=add_start_index)
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                          length_function=estimate_tokens, separators=SECTION_SEPARATORS,
+                                          is_separator_regex=True, add_start_index=add_start_index)
+
+
+def overlap_report(sources, chunks):
+    """What splitting sources into chunks costs: tokens embedded beyond the source text, chunk size spread"""
+    source_tokens = sum(estimate_tokens(doc.page_content) for doc in sources)
+    chunk_tokens = [estimate_tokens(doc.page_content) for doc in chunks]
+    total = sum(chunk_tokens)
+    return {
+        "chunks": len(chunks),
+        "source_tokens": source_tokens,
+        "chunk_tokens": total,
+        "overlap_overhead": round(total / source_tokens - 1, 4) if source_tokens else 0.0,
+        "mean_chunk_tokens": round(total / len(chunks), 1) if chunks else 0.0,
+        "max_chunk_tokens": max(chunk_tokens, default=0),
+    }
@@ -0,0 +1,109 @@
+import os
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from tokens import estimate_tokens
+
+## gemma2-9b-it has an 8k context; leave room for the prompt and the answer
+STUFF_MAX_TOKENS = int(os.getenv("SUMMARY_STUFF_MAX_TOKENS", "5000"))
+MAP_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+MAP_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+
+
+def documents_text(docs):
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+def summary_strategy(docs, stuff_max_tokens=STUFF_MAX_TOKENS):
+    """'stuff' when the content fits in one prompt, else 'map_reduce'"""
+    return "stuff" if estimate_tokens(documents_text(docs)) <= stuff_max_tokens else "map_reduce"
+
+
+def _pack(texts, max_tokens):
+    """Group consecutive texts so each group stays within max_tokens"""
+    groups, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return ["\n\n".join(group) for group in groups]
+
+
+def _split(text, chunk_tokens):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_tokens, chunk_overlap=0, length_function=estimate_tokens)
+    return splitter.split_text(text)
+
+
+def _needs_reduce(partials, stuff_max_tokens):
+    """True until the partial summaries fit into one final call"""
+    return len(partials) > 1 and estimate_tokens("\n\n".join(partials)) > stuff_max_tokens
+
+
+def _reduce_groups(partials, stuff_max_tokens):
+    """Inputs of the next reduce level"""
+    groups = _pack(partials, stuff_max_tokens)
+    if len(groups) == len(partials):
+        ## partials too large to pack; merge pairwise so every level still shrinks
+        groups = ["\n\n".join(partials[i:i + 2]) for i in range(0, len(partials), 2)]
+    return groups
+
+
+def summarize_documents(llm, docs, prompt, stuff_max_tokens=STUFF_MAX_TOKENS, chunk_tokens=MAP_CHUNK_TOKENS,
+                        max_concurrency=MAP_CONCURRENCY, config=None):
+    """
+    Summarize docs with prompt (a template with a {text} variable).
+
+    Content that fits in stuff_max_tokens is summarized in a single call.
+    Longer content is split into chunk_tokens pieces summarized concurrently
+    (at most max_concurrency calls in flight), then the partial summaries
+    are combined level by level until they fit into one final call.
+    """
+    chain = prompt | llm | StrOutputParser()
+    text = documents_text(docs)
+    if estimate_tokens(text) <= stuff_max_tokens:
+        return chain.invoke({"text": text}, config)
+
+    batch_config = {**(config or {}), "max_concurrency": max_concurrency}
+    partials = chain.batch([{"text": chunk} for chunk in _split(text, chunk_tokens)], batch_config)
+    while _needs_reduce(partials, stuff_max_tokens):
+        groups = _reduce_groups(partials, stuff_max_tokens)
+        partials = chain.batch([{"text": group} for group in groups], batch_config)
+    return chain.invoke({"text": "\n\n".join(partials)}, config)
+
+
+def _rate_limited(limiter):
+    """Pass-through step that waits for limiter.acquire() before every LLM call behind it"""
+    async def acquire(value):
+        await limiter.acquire()
+        return value
+
+    return RunnableLambda(acquire)
+
+
+async def asummarize_documents(llm, docs, prompt, stuff_max_tokens=STUFF_MAX_TOKENS, chunk_tokens=MAP_CHUNK_TOKENS,
+                               max_concurrency=MAP_CONCURRENCY, config=None, limiter=None):
+    """
+    summarize_documents for async callers: every LLM call is awaited through
+    ainvoke/abatch. With a limiter (anything with an async acquire()), each
+    map, reduce and final call takes one acquisition.
+    """
+    if limiter is not None:
+        llm = _rate_limited(limiter) | llm
+    chain = prompt | llm | StrOutputParser()
+    text = documents_text(docs)
+    if estimate_tokens(text) <= stuff_max_tokens:
+        return await chain.ainvoke({"text": text}, config)
+
+    batch_config = {**(config or {}), "max_concurrency": max_concurrency}
+    partials = await chain.abatch([{"text": chunk} for chunk in _split(text, chunk_tokens)], batch_config)
+    while _needs_reduce(partials, stuff_max_tokens):
+        groups = _reduce_groups(partials, stuff_max_tokens)
+        partials = await chain.abatch([{"text": group} for group in groups], batch_config)
+    return await chain.ainvoke({"text": "\n\n".join(partials)}, config)
@@ -1,10 +1,11 @@
 import validators, streamlit as st
-from langchain.prompts import PromptTemplate
-from langchain_groq import ChatGroq
-from langchain.chains.summarize import load_summarize_chain
+from langchain_core.prompts import PromptTemplate
 from langchain_core.documents import Document
-from langchain_community.document_loaders import UnstructuredURLLoader
-from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound, VideoUnavailable, CouldNotRetrieveTranscript
+from models import groq_llm
+from response_cache import ResponseCache, llm_identity
+from summarization import summarize_documents, summary_strategy
+from tracing import callbacks_config, show_trace_panel, start_metrics_server, tracer
+import tracing
 import re
 from dotenv import load_dotenv
 import traceback
@@ -16,7 +17,13 @@ st.title("🦜 Summarize Text From YT or Website")
 st.subheader('Summarize URL')
 generic_url = st.text_input("URL", label_visibility="collapsed")
 
-llm = ChatGroq(model_name="gemma2-9b-it", groq_api_key=groq_api_key)
+# one client per process instead of one per rerun
+@st.cache_resource
+def get_llm(api_key):
+    return groq_llm("gemma2-9b-it", api_key)
+
+llm = get_llm(groq_api_key)
+start_metrics_server()  # no-op unless TRACE_METRICS_PORT is set
 
 prompt_template = """
 You are a professional summarizer. Summarize the following content clearly in **less than 300 words** without repeating phrases, filler text, or requests for more context. Use clear bullet points if appropriate. Return only the clean summary without any preamble, disclaimers, or repeated patterns.
@@ -24,6 +31,12 @@ Content:\n{text}
 """
 prompt = PromptTemplate(template=prompt_template, input_variables=["text"])
 
+# exact matches only: summaries are keyed by the full page text, so
+# RESPONSE_CACHE_SIMILARITY does not apply here (ResponseCache logs a warning)
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache()
+
 def get_video_id(url):
     pattern = r'(?:v=|\\/)([0-9A-Za-z_-]{11}).*'
     match = re.search(pattern, url)
@@ -36,13 +49,16 @@ if st.button("Summarize"):
         st.error("Please enter a valid URL. It can be a YouTube video URL or a website URL.")
     else:
         try:
-            with st.spinner("Loading and summarizing..."):
+            with st.spinner("Loading and summarizing..."), tracer.trace("url_summarizer", "summarize") as trace:
                 if "youtube.com" in generic_url or "youtu.be" in generic_url:
                     video_id = get_video_id(generic_url)
                     if not video_id:
                         st.error("Invalid YouTube URL. Please ensure you provided a correct video URL.")
                         st.stop()
 
+                    # only YouTube URLs need the transcript API
+                    from youtube_transcript_api import (YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound,
+                                                        VideoUnavailable, CouldNotRetrieveTranscript)
                     try:
                         # Attempt to fetch Hindi transcript if English not available
                         try:
@@ -63,21 +79,32 @@ if st.button("Summarize"):
                         st.text(traceback.format_exc())
                         st.stop()
                 else:
+                    # unstructured is only imported once a web page is summarized
+                    from langchain_community.document_loaders import UnstructuredURLLoader
                     loader = UnstructuredURLLoader(
                         urls=[generic_url],
                         ssl_verify=False,
                         headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
                                  "(KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36"}
                     )
-                    docs = loader.load()
+                    with tracing.stage("fetch"):
+                        docs = loader.load()
 
-                chain = load_summarize_chain(llm, chain_type="stuff", prompt=prompt)
-                output_summary = chain.run(docs)
+                ## long transcripts/pages are summarized in parallel chunks and then combined
+                if summary_strategy(docs) == "map_reduce":
+                    st.info("Long content detected, summarizing it in parts...")
+                output_summary = get_response_cache().get_or_compute(
+                    (*llm_identity(llm), prompt_template, [doc.page_content for doc in docs]),
+                    lambda: summarize_documents(llm, docs, prompt, config=callbacks_config(trace)),
+                )
                 output_words = output_summary.split()
                 if len(output_words) > 300:
                     output_summary = " ".join(output_words[:300]) + "..."
-                st.success(output_summary)
+            st.session_state.last_trace = trace.as_dict()
+            st.success(output_summary)
 
         except Exception as e:
             st.error(f"An error occurred: {e}")
             st.text(traceback.format_exc())
+
+show_trace_panel(st.session_state.get("last_trace"))
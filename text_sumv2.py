@@ -1,16 +1,16 @@
 import validators, streamlit as st
-from langchain.prompts import PromptTemplate
-from langchain_groq import ChatGroq
-from langchain.chains.summarize import load_summarize_chain
 from langchain_core.documents import Document
-from langchain_community.document_loaders import UnstructuredURLLoader
-from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound, VideoUnavailable, CouldNotRetrieveTranscript
-import re
+from models import groq_llm
+from response_cache import ResponseCache, llm_identity
+from summarization import documents_text, summarize_documents, summary_strategy
+from tracing import callbacks_config, show_trace_panel, start_metrics_server, tracer
+import tracing
+from content_cache import ContentCache, content_key
+from url_summarizer import (NEGATIVE_STATUSES, SUMMARY_MODEL, get_video_id, get_youtube_transcript_robust,
+                            is_youtube_url, limit_words, load_website, prompt, prompt_template)
 from dotenv import load_dotenv
 import traceback
 import os
-import requests
-import time
 
 load_dotenv()
 groq_api_key = os.getenv('GROQ_API_KEY')
@@ -20,104 +20,42 @@ st.title("🦜 Summarize Text From YT or Website")
 st.subheader('Summarize URL')
 generic_url = st.text_input("URL", label_visibility="collapsed")
 
-llm = ChatGroq(model_name="gemma2-9b-it", groq_api_key=groq_api_key)
+# one client per process instead of one per rerun
+@st.cache_resource
+def get_llm(api_key):
+    return groq_llm(SUMMARY_MODEL, api_key)
 
-prompt_template = """
-You are a professional summarizer. Summarize the following content clearly in **less than 300 words** without repeating phrases, filler text, or requests for more context. Use clear bullet points if appropriate. Return only the clean summary without any preamble, disclaimers, or repeated patterns.
-Content:\n{text}
-"""
-prompt = PromptTemplate(template=prompt_template, input_variables=["text"])
+llm = get_llm(groq_api_key)
+start_metrics_server()  # no-op unless TRACE_METRICS_PORT is set
 
-def get_video_id(url):
-    """Extract video ID from various YouTube URL formats"""
-    patterns = [
-        r'(?:v=|/)([0-9A-Za-z_-]{11}).*',
-        r'(?:embed/)([0-9A-Za-z_-]{11})',
-        r'(?:youtu\.be/)([0-9A-Za-z_-]{11})',
-        r'(?:watch\?v=)([0-9A-Za-z_-]{11})'
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    return None
+# exact matches only: summaries are keyed by the full page text, so
+# RESPONSE_CACHE_SIMILARITY does not apply here (ResponseCache logs a warning)
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache()
 
-def get_youtube_transcript_robust(video_id, max_retries=3):
-    """
-    Robust YouTube transcript retrieval with multiple fallback strategies
-    """
-    # Extended language list - try more languages
-    language_codes = [
-        'en', 'hi',  # Primary languages
-        'en-US', 'en-GB', 'en-CA', 'en-AU',  # English variants
-        'hi-IN',  # Hindi variant
-        'es', 'fr', 'de', 'it', 'pt', 'ru', 'ja', 'ko', 'zh',  # Other common languages
-        'ar', 'bn', 'ta', 'te', 'mr', 'gu', 'kn', 'ml', 'pa',  # Indian languages
-        'auto'  # Auto-generated if available
-    ]
-    
-    for attempt in range(max_retries):
-        try:
-            # Method 1: Try with specific language preferences
-            try:
-                transcript = YouTubeTranscriptApi.get_transcript(
-                    video_id, 
-                    languages=language_codes[:10]  # Try first 10 languages
-                )
-                transcript_text = " ".join([t['text'] for t in transcript])
-                return transcript_text, "success"
-            except (TranscriptsDisabled, NoTranscriptFound):
-                pass
-            
-            # Method 2: Try to get any available transcript
-            try:
-                transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
-                
-                # First, try manually created transcripts
-                for transcript in transcript_list:
-                    if not transcript.is_generated:
-                        try:
-                            transcript_data = transcript.fetch()
-                            transcript_text = " ".join([t['text'] for t in transcript_data])
-                            return transcript_text, "manual_transcript"
-                        except:
-                            continue
-                
-                # Then try auto-generated transcripts
-                for transcript in transcript_list:
-                    if transcript.is_generated:
-                        try:
-                            transcript_data = transcript.fetch()
-                            transcript_text = " ".join([t['text'] for t in transcript_data])
-                            return transcript_text, "auto_generated"
-                        except:
-                            continue
-                            
-            except Exception as e:
-                st.warning(f"Attempt {attempt + 1}: {str(e)}")
-                
-            # Wait before retry
-            if attempt < max_retries - 1:
-                time.sleep(2)
-                
-        except VideoUnavailable:
-            return None, "video_unavailable"
-        except Exception as e:
-            if attempt == max_retries - 1:
-                return None, f"error: {str(e)}"
-            time.sleep(2)
-    
-    return None, "no_transcripts_found"
+@st.cache_resource
+def get_content_cache():
+    return ContentCache()
 
-def check_video_accessibility(video_id):
-    """Check if video is accessible"""
-    try:
-        # Simple check using YouTube's oembed API
-        response = requests.get(f"https://www.youtube.com/oembed?url=https://www.youtube.com/watch?v={video_id}&format=json", timeout=10)
-        return response.status_code == 200
-    except:
-        return True  # Assume accessible if check fails
+def show_transcript_error(status):
+    """Explain why no transcript could be used"""
+    if status == "video_inaccessible":
+        st.error("This YouTube video appears to be unavailable or private.")
+    elif status == "video_unavailable":
+        st.error("This YouTube video is unavailable. It may be private, removed, or region-blocked.")
+    elif status == "no_transcripts_found":
+        st.error("No captions/transcripts are available for this video. This could be because:")
+        st.markdown("""
+        - The video doesn't have captions enabled
+        - The video is too new (captions may be processing)
+        - The video is in a language not supported
+        - Regional restrictions apply
+        
+        Please try a different video with captions enabled.
+        """)
+    else:
+        st.error(f"Error retrieving transcript: {status}")
 
 if st.button("Summarize"):
     if not groq_api_key.strip() or not generic_url.strip():
@@ -126,74 +64,79 @@ if st.button("Summarize"):
         st.error("Please enter a valid URL. It can be a YouTube video URL or a website URL.")
     else:
         try:
-            with st.spinner("Loading and summarizing..."):
-                if "youtube.com" in generic_url or "youtu.be" in generic_url:
+            with st.spinner("Loading and summarizing..."), tracer.trace("url_summarizer", "summarize") as trace:
+                content_cache = get_content_cache()
+                summary_key = ResponseCache.make_key(*llm_identity(llm), prompt_template)
+                is_youtube = is_youtube_url(generic_url)
+                video_id = None
+                if is_youtube:
                     video_id = get_video_id(generic_url)
                     if not video_id:
                         st.error("Invalid YouTube URL. Please ensure you provided a correct video URL.")
                         st.stop()
 
-                    # Check video accessibility first
-                    st.info("Checking video accessibility...")
-                    if not check_video_accessibility(video_id):
-                        st.error("This YouTube video appears to be unavailable or private.")
-                        st.stop()
+                cache_key = content_key(generic_url, video_id)
+                cached = content_cache.get(cache_key)
+                if cached and cached["negative"]:
+                    show_transcript_error(cached["source"])
+                    st.stop()
 
-                    # Try robust transcript retrieval
-                    st.info("Attempting to retrieve transcript...")
-                    transcript_text, status = get_youtube_transcript_robust(video_id)
-                    
-                    if transcript_text:
-                        if status == "auto_generated":
-                            st.info("Using auto-generated captions (may be less accurate)")
-                        elif status == "manual_transcript":
-                            st.info("Using manual captions")
+                if cached and cached["summary"] and cached["summary_key"] == summary_key:
+                    st.info("Loaded summary from cache")
+                    output_summary = cached["summary"]
+                else:
+                    if cached:
+                        st.info("Using cached content")
+                        docs = [Document(page_content=cached["text"])]
+                    elif is_youtube:
+                        # Try robust transcript retrieval
+                        st.info("Checking video accessibility and retrieving transcript...")
+                        with tracing.stage("fetch"):
+                            transcript_text, status = get_youtube_transcript_robust(video_id)
                         
-                        docs = [Document(page_content=transcript_text)]
-                    else:
-                        # Provide more specific error messages
-                        if status == "video_unavailable":
-                            st.error("This YouTube video is unavailable. It may be private, removed, or region-blocked.")
-                        elif status == "no_transcripts_found":
-                            st.error("No captions/transcripts are available for this video. This could be because:")
-                            st.markdown("""
-                            - The video doesn't have captions enabled
-                            - The video is too new (captions may be processing)
-                            - The video is in a language not supported
-                            - Regional restrictions apply
+                        if transcript_text:
+                            if status == "auto_generated":
+                                st.info("Using auto-generated captions (may be less accurate)")
+                            elif status == "manual_transcript":
+                                st.info("Using manual captions")
                             
-                            Please try a different video with captions enabled.
-                            """)
+                            docs = [Document(page_content=transcript_text)]
+                            content_cache.put(cache_key, transcript_text, status)
                         else:
-                            st.error(f"Error retrieving transcript: {status}")
-                        st.stop()
-                        
-                else:
-                    # Website URL processing
-                    st.info("Loading website content...")
-                    loader = UnstructuredURLLoader(
-                        urls=[generic_url],
-                        ssl_verify=False,
-                        headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                                 "(KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36"}
-                    )
-                    docs = loader.load()
+                            # Provide more specific error messages
+                            if status in NEGATIVE_STATUSES:
+                                content_cache.put_negative(cache_key, status)
+                            show_transcript_error(status)
+                            st.stop()
+                            
+                    else:
+                        # Website URL processing
+                        st.info("Loading website content...")
+                        with tracing.stage("fetch"):
+                            docs = load_website(generic_url)
+                        content_cache.put(cache_key, documents_text(docs), "website")
 
-                # Generate summary
-                st.info("Generating summary...")
-                chain = load_summarize_chain(llm, chain_type="stuff", prompt=prompt)
-                output_summary = chain.run(docs)
-                
-                # Ensure word limit
-                output_words = output_summary.split()
-                if len(output_words) > 300:
-                    output_summary = " ".join(output_words[:300]) + "..."
+                    # Generate summary
+                    st.info("Generating summary...")
+                    ## long transcripts/pages are summarized in parallel chunks and then combined
+                    if summary_strategy(docs) == "map_reduce":
+                        st.info("Long content detected, summarizing it in parts...")
+                    output_summary = get_response_cache().get_or_compute(
+                        (*llm_identity(llm), prompt_template, [doc.page_content for doc in docs]),
+                        lambda: summarize_documents(llm, docs, prompt, config=callbacks_config(trace)),
+                    )
+                    
+                    output_summary = limit_words(output_summary)
+                    content_cache.set_summary(cache_key, output_summary, summary_key)
                 
-                st.success("Summary generated successfully!")
-                st.markdown("### Summary:")
-                st.write(output_summary)
+            st.session_state.last_trace = trace.as_dict()
+            st.success("Summary generated successfully!")
+            st.markdown("### Summary:")
+            st.write(output_summary)
 
         except Exception as e:
             st.error(f"An unexpected error occurred: {e}")
             with st.expander("View detailed error"):
                 st.text(traceback.format_exc())
+
+show_trace_panel(st.session_state.get("last_trace"))
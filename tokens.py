@@ -0,0 +1,26 @@
+import functools
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    ## tiktoken ships with langchain-openai; fall back to a character heuristic without it
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def estimate_tokens(text):
+    """Approximate token count of text, good enough for budgeting prompts"""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def message_tokens(message):
+    """Token estimate of a chat message, including a few tokens of role overhead"""
+    return estimate_tokens(str(message.content)) + 4
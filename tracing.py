@@ -0,0 +1,357 @@
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from tokens import estimate_tokens, message_tokens
+
+## every finished trace is appended here as one JSON line when set
+TRACE_LOG = os.getenv("TRACE_LOG")
+## Prometheus text exposition on http://host:TRACE_METRICS_PORT/metrics when set
+METRICS_PORT = int(os.getenv("TRACE_METRICS_PORT", "0"))
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+## named LangChain runs worth a stage of their own, and what an LLM call below them is doing
+CHAIN_STAGES = {
+    "fast_history_aware_retriever": "history_aware_retrieve",
+    "stuff_documents_chain": "stuff_documents",
+    "retrieval_chain": "retrieval_chain",
+}
+LLM_STAGES = {
+    "fast_history_aware_retriever": "llm.rewrite",
+    "stuff_documents_chain": "llm.generate",
+}
+
+_current_trace = ContextVar("current_trace", default=None)
+
+
+class Trace(BaseCallbackHandler):
+    """
+    Stage timings, token counts and counters of one request. Pass it as a
+    callback (config={"callbacks": [trace]}) to record chain, retriever and
+    LLM runs; wrap other work in trace.stage(name).
+    """
+
+    ## thread-safe, so async chains can call it directly instead of through an executor
+    run_inline = True
+
+    def __init__(self, app, name):
+        self.app = app
+        self.name = name
+        self.started_at = time.time()
+        self.seconds = None
+        self.error = None
+        self.stages = []
+        self.counters = Counter()
+        self._started = time.perf_counter()
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def _add(self, record):
+        with self._lock:
+            self.stages.append(record)
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """Time the block as stage name; the yielded dict can take extra fields such as documents"""
+        record = {"stage": name, **fields}
+        started = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record["error"] = type(e).__name__
+            raise
+        finally:
+            record["seconds"] = time.perf_counter() - started
+            self._add(record)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def finish(self, error=None):
+        self.seconds = time.perf_counter() - self._started
+        self.error = error
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "app": self.app,
+                "name": self.name,
+                "started_at": self.started_at,
+                "seconds": self.seconds,
+                "error": self.error,
+                "stages": [dict(s) for s in self.stages],
+                "counters": dict(self.counters),
+            }
+
+    ## LangChain callbacks
+
+    def _start_run(self, run_id, parent_run_id, name, **fields):
+        with self._lock:
+            self._runs[run_id] = {"name": name, "parent": parent_run_id, "started": time.perf_counter(), **fields}
+
+    def _end_run(self, run_id, **fields):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None or run["stage"] is None:
+            return
+        record = {"stage": run["stage"], "seconds": time.perf_counter() - run["started"], **fields}
+        for key in ("model", "prompt_tokens", "ttft_seconds"):
+            if run.get(key) is not None:
+                record.setdefault(key, run[key])
+        self._add(record)
+
+    def _llm_stage(self, parent_run_id):
+        with self._lock:
+            while parent_run_id in self._runs:
+                run = self._runs[parent_run_id]
+                if run["name"] in LLM_STAGES:
+                    return LLM_STAGES[run["name"]]
+                parent_run_id = run["parent"]
+        return "llm"
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        self._start_run(run_id, parent_run_id, name, stage=CHAIN_STAGES.get(name))
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end_run(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end_run(run_id, error=type(error).__name__)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        self._start_run(run_id, parent_run_id, kwargs.get("name"), stage="retrieve")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self.count("retrieved_documents", len(documents))
+        self._end_run(run_id, documents=len(documents))
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end_run(run_id, error=type(error).__name__)
+
+    def _start_llm(self, run_id, parent_run_id, prompt_tokens, kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model_name") or params.get("model")
+        self._start_run(run_id, parent_run_id, None, stage=self._llm_stage(parent_run_id), model=model,
+                        prompt_tokens=prompt_tokens)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        prompt_tokens = sum(message_tokens(m) for batch in messages for m in batch)
+        self._start_llm(run_id, parent_run_id, prompt_tokens, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start_llm(run_id, parent_run_id, sum(estimate_tokens(p) for p in prompts), kwargs)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is not None and run.get("ttft_seconds") is None:
+                run["ttft_seconds"] = time.perf_counter() - run["started"]
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        ## reported usage when the provider sends it, otherwise the local estimate
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens, completion_tokens = usage.get("prompt_tokens"), usage.get("completion_tokens")
+        if completion_tokens is None:
+            completion_tokens = 0
+            for generation in (g for batch in response.generations for g in batch):
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if metadata:
+                    prompt_tokens = metadata.get("input_tokens", prompt_tokens)
+                    completion_tokens += metadata.get("output_tokens", 0)
+                else:
+                    completion_tokens += estimate_tokens(generation.text)
+        if prompt_tokens is None:
+            with self._lock:
+                prompt_tokens = (self._runs.get(run_id) or {}).get("prompt_tokens") or 0
+        self.count("prompt_tokens", prompt_tokens)
+        self.count("completion_tokens", completion_tokens)
+        self._end_run(run_id, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end_run(run_id, error=type(error).__name__)
+
+
+class Tracer:
+    """Collects finished traces into Prometheus metrics, an optional JSONL log and a short recent list"""
+
+    def __init__(self, log_path=TRACE_LOG, keep=100):
+        self.log_path = log_path
+        self.recent = deque(maxlen=keep)
+        self._histograms = {}
+        self._counters = Counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def trace(self, app, name):
+        """Trace of one request, current for stage()/count() in this context until the block ends"""
+        trace = Trace(app, name)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.finish(error=type(e).__name__)
+            raise
+        finally:
+            _current_trace.reset(token)
+            if trace.seconds is None:
+                trace.finish()
+            self.export(trace)
+
+    def _observe(self, labels, seconds):
+        counts = self._histograms.setdefault(labels, [0] * len(STAGE_BUCKETS) + [0, 0.0])
+        for i, bound in enumerate(STAGE_BUCKETS):
+            if seconds <= bound:
+                counts[i] += 1
+        counts[-2] += 1
+        counts[-1] += seconds
+
+    def export(self, trace):
+        record = trace.as_dict()
+        with self._lock:
+            self.recent.append(record)
+            self._counters[("requests_total", (("app", trace.app), ("trace", trace.name),
+                                               ("status", "error" if trace.error else "ok")))] += 1
+            self._observe((("app", trace.app), ("stage", f"{trace.name}.total")), trace.seconds)
+            for stage in record["stages"]:
+                labels = (("app", trace.app), ("stage", stage["stage"]))
+                self._observe(labels, stage["seconds"])
+                for kind in ("prompt", "completion"):
+                    if stage.get(f"{kind}_tokens"):
+                        self._counters[("tokens_total", labels + (("kind", kind),))] += stage[f"{kind}_tokens"]
+            for event, n in record["counters"].items():
+                if not event.endswith("_tokens"):
+                    self._counters[("events_total", (("app", trace.app), ("event", event)))] += n
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def prometheus_text(self):
+        """All metrics in the Prometheus text exposition format"""
+
+        def fmt(labels):
+            return ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in labels)
+
+        lines = ["# HELP llmapps_stage_seconds Wall time per request stage",
+                 "# TYPE llmapps_stage_seconds histogram"]
+        with self._lock:
+            for labels, counts in sorted(self._histograms.items()):
+                for bound, n in zip(STAGE_BUCKETS, counts):
+                    lines.append(f'llmapps_stage_seconds_bucket{{{fmt(labels + (("le", bound),))}}} {n}')
+                lines.append(f'llmapps_stage_seconds_bucket{{{fmt(labels + (("le", "+Inf"),))}}} {counts[-2]}')
+                lines.append(f"llmapps_stage_seconds_sum{{{fmt(labels)}}} {counts[-1]}")
+                lines.append(f"llmapps_stage_seconds_count{{{fmt(labels)}}} {counts[-2]}")
+            declared = set()
+            for (metric, labels), value in sorted(self._counters.items()):
+                if metric not in declared:
+                    lines.append(f"# TYPE llmapps_{metric} counter")
+                    declared.add(metric)
+                lines.append(f"llmapps_{metric}{{{fmt(labels)}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+## process-wide, shared by every session and request
+tracer = Tracer()
+
+
+def percentile(values, q):
+    """Linearly interpolated percentile of values, q in [0, 1]; 0.0 for no values"""
+    values = sorted(values)
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def stage(name, **fields):
+    """trace.stage(name) on the current trace, a no-op outside of one"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield dict(fields)
+        return
+    with trace.stage(name, **fields) as record:
+        yield record
+
+
+def count(name, n=1):
+    """Bump a counter such as a cache hit on the current trace, if any"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.count(name, n)
+
+
+def callbacks_config(trace, config=None):
+    """config with trace added to its callbacks"""
+    config = dict(config or {})
+    config["callbacks"] = [*(config.get("callbacks") or []), trace]
+    return config
+
+
+_metrics_server = None
+_metrics_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT, metrics_tracer=tracer):
+    """Serve /metrics from a daemon thread, once per process; returns the server or None when port is 0"""
+    global _metrics_server
+    with _metrics_lock:
+        if _metrics_server is not None or not port:
+            return _metrics_server
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics_tracer.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        _metrics_server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+        threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+        return _metrics_server
+
+
+def show_trace_panel(trace):
+    """Streamlit sidebar expander with the stage breakdown of a trace dict"""
+    import streamlit as st
+
+    with st.sidebar.expander("Debug: last request"):
+        if not trace:
+            st.caption("No request yet")
+            return
+        status = f" ({trace['error']})" if trace["error"] else ""
+        st.caption(f"{trace['name']}: {trace['seconds'] * 1000:.0f} ms{status}")
+        st.dataframe([
+            {
+                "stage": s["stage"],
+                "ms": round(s["seconds"] * 1000, 1),
+                "prompt tokens": s.get("prompt_tokens"),
+                "completion tokens": s.get("completion_tokens"),
+                "documents": s.get("documents"),
+            }
+            for s in trace["stages"]
+        ], hide_index=True)
+        if trace["counters"]:
+            st.json(trace["counters"])
@@ -0,0 +1,149 @@
+"""
+Check the YouTube transcript path against a local stub, without network access.
+
+    python transcript_stub.py
+
+Serves YouTube's oembed endpoint from a local HTTP server and replaces the
+transcript listing with a scripted fake, then checks that retryable errors
+are retried with backoff, definitive answers are not, an inaccessible video
+short-circuits the listing, and summarize_url answers a repeated negative
+lookup from the content cache without touching the network. Prints one line
+per check and exits non-zero when any fails.
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from youtube_transcript_api import TranscriptsDisabled
+
+import transcripts
+from content_cache import ContentCache
+from url_summarizer import summarize_url
+
+PUBLIC_VIDEO = "pubVideo001"
+PRIVATE_VIDEO = "privVideo01"
+
+
+class OembedStub(BaseHTTPRequestHandler):
+    """200 for every video except PRIVATE_VIDEO, which gets 404 like a private or removed one"""
+
+    requests_served = 0
+
+    def do_GET(self):
+        type(self).requests_served += 1
+        video_url = parse_qs(urlsplit(self.path).query).get("url", [""])[0]
+        status = 404 if video_url.endswith(PRIVATE_VIDEO) else 200
+        body = json.dumps({"title": "stub"}).encode() if status == 200 else b"Not Found"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeTranscript:
+    def __init__(self, language_code, is_generated, text):
+        self.language_code = language_code
+        self.is_generated = is_generated
+        self.text = text
+
+    def fetch(self):
+        return [{"text": word} for word in self.text.split()]
+
+
+class ScriptedListing:
+    """list_transcripts stand-in that raises the scripted errors in order, then returns transcripts"""
+
+    def __init__(self, errors=(), transcript_list=(), delay=0.0):
+        self.errors = list(errors)
+        self.transcript_list = list(transcript_list)
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, video_id):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.transcript_list
+
+
+def start_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OembedStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/oembed"
+
+
+async def run_checks(oembed_url, scratch):
+    checks = []
+
+    def check(name, passed, detail):
+        checks.append(passed)
+        print(f"{'ok  ' if passed else 'FAIL'} {name}: {detail}")
+
+    manual = FakeTranscript("en", False, "hello from the stub")
+    generated = FakeTranscript("en", True, "auto generated words")
+
+    listing = ScriptedListing([requests.ConnectionError("reset"), requests.ConnectionError("reset")],
+                              [generated, manual])
+    started = time.perf_counter()
+    result = await transcripts.fetch_transcript(PUBLIC_VIDEO, list_transcripts=listing, oembed_url=oembed_url)
+    elapsed = time.perf_counter() - started
+    check("retryable errors are retried", result == ("hello from the stub", "manual_transcript") and listing.calls == 3,
+          f"{result}, {listing.calls} listing calls in {elapsed:.2f}s")
+
+    listing = ScriptedListing([requests.ConnectionError("reset")] * 5)
+    result = await transcripts.fetch_transcript(PUBLIC_VIDEO, list_transcripts=listing, oembed_url=oembed_url,
+                                                max_retries=3)
+    check("retries stop at max_retries", result[1].startswith("error") and listing.calls == 3,
+          f"{result[1]!r} after {listing.calls} listing calls")
+
+    listing = ScriptedListing([TranscriptsDisabled(PUBLIC_VIDEO)])
+    result = await transcripts.fetch_transcript(PUBLIC_VIDEO, list_transcripts=listing, oembed_url=oembed_url)
+    check("definitive answers are not retried", result == (None, "no_transcripts_found") and listing.calls == 1,
+          f"{result}, {listing.calls} listing call")
+
+    listing = ScriptedListing([], [manual], delay=1.0)
+    started = time.perf_counter()
+    result = await transcripts.fetch_transcript(PRIVATE_VIDEO, list_transcripts=listing, oembed_url=oembed_url)
+    elapsed = time.perf_counter() - started
+    check("inaccessible video short-circuits", result == (None, "video_inaccessible") and elapsed < 1.0,
+          f"{result} in {elapsed:.2f}s")
+
+    ## summarize_url passes neither, so point the module defaults at the stub
+    transcripts.OEMBED_URL = oembed_url
+    transcripts.default_list_transcripts = ScriptedListing([], [manual], delay=1.0)
+    content_cache = ContentCache(path=os.path.join(scratch, "content.sqlite"))
+    url = f"https://www.youtube.com/watch?v={PRIVATE_VIDEO}"
+    first = await summarize_url(url, None, content_cache)
+    served = OembedStub.requests_served
+    second = await summarize_url(url, None, content_cache)
+    check("negative results are cached",
+          first["status"] == second["status"] == "video_inaccessible" and second["cached"]
+          and OembedStub.requests_served == served,
+          f"first {first['status']} (cached={first['cached']}), second {second['status']} "
+          f"(cached={second['cached']}), {OembedStub.requests_served - served} stub requests on the repeat")
+    return all(checks)
+
+
+def main():
+    server, oembed_url = start_stub()
+    try:
+        with tempfile.TemporaryDirectory() as scratch:
+            passed = asyncio.run(run_checks(oembed_url, scratch))
+    finally:
+        server.shutdown()
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import random
+
+import httpx
+import requests
+from youtube_transcript_api import NoTranscriptFound, TranscriptsDisabled, VideoUnavailable, YouTubeTranscriptApi
+
+## point at a local stub server in tests
+OEMBED_URL = os.getenv("YOUTUBE_OEMBED_URL", "https://www.youtube.com/oembed")
+
+LANGUAGE_PRIORITY = [
+    'en', 'hi',  # Primary languages
+    'en-US', 'en-GB', 'en-CA', 'en-AU',  # English variants
+    'hi-IN',  # Hindi variant
+    'es', 'fr', 'de', 'it', 'pt', 'ru', 'ja', 'ko', 'zh',  # Other common languages
+    'ar', 'bn', 'ta', 'te', 'mr', 'gu', 'kn', 'ml', 'pa',  # Indian languages
+]
+
+RETRYABLE_ERRORS = {"YouTubeRequestFailed", "TooManyRequests"}
+
+
+def is_retryable(exc):
+    """Network hiccups and throttling; missing or disabled transcripts are a definitive answer"""
+    if isinstance(exc, (requests.RequestException, httpx.TransportError, TimeoutError, ConnectionError)):
+        return True
+    return type(exc).__name__ in RETRYABLE_ERRORS
+
+
+async def with_backoff(call, max_retries=3, base_delay=0.5, max_delay=8.0):
+    """Await call(), retrying only retryable errors with jittered exponential backoff"""
+    for attempt in range(max_retries):
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == max_retries - 1 or not is_retryable(e):
+                raise
+            await asyncio.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+
+def default_list_transcripts(video_id):
+    if hasattr(YouTubeTranscriptApi, "list_transcripts"):
+        return YouTubeTranscriptApi.list_transcripts(video_id)
+    return YouTubeTranscriptApi().list(video_id)
+
+
+def transcript_text(data):
+    """Join fetched transcript snippets, old (dicts) or new (objects) API style"""
+    return " ".join(t['text'] if isinstance(t, dict) else t.text for t in data)
+
+
+def rank_transcripts(transcripts, languages=LANGUAGE_PRIORITY):
+    """
+    Order transcripts best first: manual ones in language priority, then
+    generated ones in language priority, then any other manual or generated.
+    """
+    def score(transcript):
+        try:
+            language_rank = languages.index(transcript.language_code)
+        except ValueError:
+            language_rank = len(languages)
+        return (language_rank == len(languages), transcript.is_generated, language_rank)
+
+    return sorted(transcripts, key=score)
+
+
+async def check_accessibility(client, video_id, oembed_url=OEMBED_URL):
+    """True/False from YouTube's oembed endpoint, None when it can't tell"""
+    try:
+        response = await client.get(
+            oembed_url,
+            params={"url": f"https://www.youtube.com/watch?v={video_id}", "format": "json"},
+            timeout=10,
+        )
+    except httpx.HTTPError:
+        return None
+    if response.status_code == 200:
+        return True
+    if response.status_code in (401, 403, 404):
+        return False
+    return None
+
+
+async def fetch_transcript(video_id, languages=LANGUAGE_PRIORITY, list_transcripts=None,
+                           oembed_url=None, max_retries=3, client=None):
+    """
+    Fetch the best available transcript of a YouTube video.
+
+    The oembed accessibility check and the transcript listing run
+    concurrently; only the highest ranked transcript is fetched, falling
+    back to the next one if that fetch fails. Only retryable errors are
+    retried. Returns (text, status) where status is "manual_transcript",
+    "auto_generated", "video_inaccessible", "video_unavailable",
+    "no_transcripts_found" or "error: ...". list_transcripts and oembed_url
+    default to default_list_transcripts and OEMBED_URL as they are at call
+    time, so a stub can replace them for callers that pass neither.
+    """
+    list_transcripts = list_transcripts or default_list_transcripts
+    oembed_url = oembed_url or OEMBED_URL
+    own_client = client is None
+    if own_client:
+        client = httpx.AsyncClient()
+    try:
+        access_task = asyncio.create_task(check_accessibility(client, video_id, oembed_url))
+        list_task = asyncio.create_task(
+            with_backoff(lambda: asyncio.to_thread(list_transcripts, video_id), max_retries)
+        )
+        done, _ = await asyncio.wait({access_task, list_task}, return_when=asyncio.FIRST_COMPLETED)
+        if access_task in done and access_task.result() is False:
+            list_task.cancel()
+            return None, "video_inaccessible"
+
+        try:
+            transcript_list = await list_task
+        except VideoUnavailable:
+            return None, "video_unavailable"
+        except (TranscriptsDisabled, NoTranscriptFound):
+            return None, "no_transcripts_found"
+        except Exception as e:
+            if await access_task is False:
+                return None, "video_inaccessible"
+            return None, f"error: {e}"
+        finally:
+            access_task.cancel()
+
+        for transcript in rank_transcripts(list(transcript_list), languages):
+            try:
+                data = await with_backoff(lambda: asyncio.to_thread(transcript.fetch), max_retries)
+            except Exception:
+                continue
+            return transcript_text(data), "auto_generated" if transcript.is_generated else "manual_transcript"
+        return None, "no_transcripts_found"
+    finally:
+        if own_client:
+            await client.aclose()
@@ -0,0 +1,145 @@
+## pieces of the URL summarizer shared by text_sumv2.py and batch_summarize.py
+import asyncio
+import re
+import time
+
+from langchain_core.documents import Document
+from langchain_core.prompts import PromptTemplate
+
+import tracing
+from content_cache import content_key
+from response_cache import ResponseCache, llm_identity
+from summarization import asummarize_documents, documents_text
+
+SUMMARY_MODEL = "gemma2-9b-it"
+SUMMARY_MAX_WORDS = 300
+
+prompt_template = """
+You are a professional summarizer. Summarize the following content clearly in **less than 300 words** without repeating phrases, filler text, or requests for more context. Use clear bullet points if appropriate. Return only the clean summary without any preamble, disclaimers, or repeated patterns.
+Content:\n{text}
+"""
+prompt = PromptTemplate(template=prompt_template, input_variables=["text"])
+
+## failures that are worth remembering so repeat requests skip the network and retry sleeps
+NEGATIVE_STATUSES = ("video_inaccessible", "video_unavailable", "no_transcripts_found")
+
+BROWSER_HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                   "(KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36"}
+
+
+def is_youtube_url(url):
+    return "youtube.com" in url or "youtu.be" in url
+
+
+def get_video_id(url):
+    """Extract video ID from various YouTube URL formats"""
+    patterns = [
+        r'(?:v=|/)([0-9A-Za-z_-]{11}).*',
+        r'(?:embed/)([0-9A-Za-z_-]{11})',
+        r'(?:youtu\.be/)([0-9A-Za-z_-]{11})',
+        r'(?:watch\?v=)([0-9A-Za-z_-]{11})'
+    ]
+
+    for pattern in patterns:
+        match = re.search(pattern, url)
+        if match:
+            return match.group(1)
+    return None
+
+
+def get_youtube_transcript_robust(video_id, max_retries=3):
+    """
+    Robust YouTube transcript retrieval: the accessibility check and the
+    transcript listing run concurrently and only the best transcript is fetched
+    """
+    from transcripts import fetch_transcript  ## youtube_transcript_api and requests, only for YouTube URLs
+    return asyncio.run(fetch_transcript(video_id, max_retries=max_retries))
+
+
+def load_website(url):
+    """Documents of a web page"""
+    from langchain_community.document_loaders import UnstructuredURLLoader  ## pulls in unstructured
+    loader = UnstructuredURLLoader(urls=[url], ssl_verify=False, headers=BROWSER_HEADERS)
+    return loader.load()
+
+
+def limit_words(summary, max_words=SUMMARY_MAX_WORDS):
+    """Ensure word limit"""
+    words = summary.split()
+    if len(words) > max_words:
+        return " ".join(words[:max_words]) + "..."
+    return summary
+
+
+async def _fetch(url, video_id, cache_key, content_cache, client, limits):
+    """(docs, source) for url, or (None, failure status)"""
+    if video_id:
+        from transcripts import fetch_transcript
+        if limits:
+            await limits["youtube"].acquire()
+        text, status = await fetch_transcript(video_id, client=client)
+        if text is None:
+            if status in NEGATIVE_STATUSES:
+                content_cache.put_negative(cache_key, status)
+            return None, status
+        content_cache.put(cache_key, text, status)
+        return [Document(page_content=text)], status
+    if limits:
+        await limits["web"].acquire()
+    docs = await asyncio.to_thread(load_website, url)
+    content_cache.put(cache_key, documents_text(docs), "website")
+    return docs, "website"
+
+
+async def summarize_url(url, llm, content_cache, client=None, limits=None, config=None):
+    """
+    Fetch and summarize one URL, going through the content cache.
+
+    limits optionally maps "youtube", "web" and "llm" to rate limiters with
+    an async acquire(), taken per transcript lookup, page load and LLM call
+    respectively; config is passed on to the LLM calls (e.g. callbacks).
+    Returns a result dict with status ("ok", "invalid_url", one of
+    NEGATIVE_STATUSES or "error"), source, summary, cached and per-stage
+    timings in seconds.
+    """
+    result = {"url": url, "status": "ok", "source": None, "summary": None, "cached": False}
+    timings = {}
+    started = time.perf_counter()
+    try:
+        video_id = get_video_id(url) if is_youtube_url(url) else None
+        if is_youtube_url(url) and not video_id:
+            result["status"] = "invalid_url"
+            return result
+        cache_key = content_key(url, video_id)
+        cached = content_cache.get(cache_key)
+        summary_key = ResponseCache.make_key(*llm_identity(llm), prompt_template)
+
+        if cached and cached["negative"]:
+            result.update(status=cached["source"], cached=True)
+        elif cached and cached["summary"] and cached["summary_key"] == summary_key:
+            result.update(source=cached["source"], summary=cached["summary"], cached=True)
+        else:
+            stage = time.perf_counter()
+            if cached:
+                docs, source = [Document(page_content=cached["text"])], cached["source"]
+            else:
+                with tracing.stage("fetch"):
+                    docs, source = await _fetch(url, video_id, cache_key, content_cache, client, limits)
+            timings["fetch"] = time.perf_counter() - stage
+            if docs is None:
+                result["status"] = source
+            else:
+                stage = time.perf_counter()
+                ## the "llm" limiter is taken per LLM call, so long content fanning out into
+                ## map-reduce calls is throttled like everything else
+                limiter = limits["llm"] if limits else None
+                summary = limit_words(await asummarize_documents(llm, docs, prompt, config=config, limiter=limiter))
+                timings["summarize"] = time.perf_counter() - stage
+                content_cache.set_summary(cache_key, summary, summary_key)
+                result.update(source=source, summary=summary)
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+    finally:
+        timings["total"] = time.perf_counter() - started
+        result["timings"] = timings
+    return result
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import shutil
+
+from langchain_community.document_loaders import PyPDFLoader
+
+from embedding_pipeline import embed_into_faiss
+import tracing
+from index_factory import INDEX_TYPE, MMAP, apply_index_type, load_store, prepare_for_delete
+from splitting import make_splitter
+
+## persisted indexes live under INDEX_DIR/<settings fingerprint>/<corpus fingerprint>/,
+## with CURRENT.json naming the newest generation for incremental updates
+INDEX_DIR = os.getenv("FAISS_INDEX_DIR", "faiss_index")
+MANIFEST_NAME = "manifest.json"
+
+
+def file_sha256(path, block_size=1 << 20):
+    """Hash a file's content without reading it into memory in one go"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def list_pdfs(pdf_dir):
+    """Sorted paths of the PDFs directly inside pdf_dir"""
+    if not os.path.isdir(pdf_dir):
+        return []
+    return sorted(
+        os.path.join(pdf_dir, name)
+        for name in os.listdir(pdf_dir)
+        if name.lower().endswith(".pdf")
+    )
+
+
+def index_settings(embeddings, chunk_size, chunk_overlap, index_type=INDEX_TYPE, splitter_mode="chars"):
+    """Everything besides the PDFs themselves that changes the vectors"""
+    embeddings = getattr(embeddings, "underlying", embeddings)  ## look through CachedEmbeddings
+    model = getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None)
+    settings = {
+        "embedding_class": type(embeddings).__name__,
+        "embedding_model": model,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "start_index": True,
+        "index_type": index_type,
+    }
+    if splitter_mode != "chars":
+        ## chunk_size/chunk_overlap are now in tokens; character indexes keep their fingerprint
+        settings["splitter_mode"] = splitter_mode
+    return settings
+
+
+def settings_fingerprint(settings):
+    return text_sha256(json.dumps(settings, sort_keys=True))[:16]
+
+
+def corpus_fingerprint(pdf_dir, settings, file_hashes=None):
+    """Content hash of the corpus plus the splitter/embedding settings"""
+    if file_hashes is None:
+        file_hashes = {os.path.basename(p): file_sha256(p) for p in list_pdfs(pdf_dir)}
+    h = hashlib.sha256()
+    h.update(json.dumps(settings, sort_keys=True).encode())
+    for name in sorted(file_hashes):
+        h.update(name.encode())
+        h.update(file_hashes[name].encode())
+    return h.hexdigest()[:32]
+
+
+def _read_json(path, default):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _load_generation(path, embeddings, mmap=False):
+    if not os.path.exists(os.path.join(path, "index.faiss")):
+        return None, None
+    vectors = load_store(path, embeddings, mmap=mmap)
+    manifest = _read_json(os.path.join(path, MANIFEST_NAME), None)
+    return vectors, manifest
+
+
+def _split_pages(pages, text_splitter, file_sha, name):
+    """
+    Split changed pages into chunks whose IDs are derived from the page hash,
+    so the same page always maps to the same vector IDs. The file name is
+    part of the ID too, so two copies of one PDF do not collide.
+    """
+    chunks, ids, page_entries = [], [], {}
+    file_id = f"{file_sha[:16]}:{text_sha256(name)[:8]}"
+    for page in pages:
+        page_no = str(page.metadata.get("page", 0))
+        page_hash = text_sha256(page.page_content)
+        page_chunks = text_splitter.split_documents([page])
+        page_ids = [f"{file_id}:{page_no}:{page_hash[:16]}:{i}" for i in range(len(page_chunks))]
+        for chunk, chunk_id in zip(page_chunks, page_ids):
+            chunk.metadata["chunk_id"] = chunk_id
+        chunks.extend(page_chunks)
+        ids.extend(page_ids)
+        page_entries[page_no] = {"hash": page_hash, "chunk_ids": page_ids}
+    return chunks, ids, page_entries
+
+
+def load_or_build_index(pdf_dir, embeddings, chunk_size=1000, chunk_overlap=200, index_dir=INDEX_DIR,
+                        remote=False, on_progress=None, index_type=INDEX_TYPE, mmap=MMAP, splitter_mode="chars",
+                        **pipeline_options):
+    """
+    Bring the persisted index in line with pdf_dir, embedding only the pages
+    that were added or changed and dropping vectors of removed pages/files.
+    New chunks go through embed_into_faiss; remote, on_progress and any
+    batch_size/max_workers options are passed on to it. The store is then
+    moved onto index_type (see index_factory). mmap memory-maps an index
+    that is already up to date instead of reading it into memory. With
+    splitter_mode="tokens", chunk_size and chunk_overlap count tokens (see
+    splitting). Indexes persisted under other settings are deleted once the
+    new one is saved.
+
+    Returns the FAISS store, or None when there is nothing to index.
+    """
+    settings = index_settings(embeddings, chunk_size, chunk_overlap, index_type, splitter_mode)
+    root = os.path.join(index_dir, settings_fingerprint(settings))
+    file_hashes = {os.path.basename(p): file_sha256(p) for p in list_pdfs(pdf_dir)}
+    if not file_hashes:
+        ## every PDF removed: same "nothing to index" answer as a cold start
+        return None
+    fingerprint = corpus_fingerprint(pdf_dir, settings, file_hashes)
+    target = os.path.join(root, fingerprint)
+
+    vectors, manifest = _load_generation(target, embeddings, mmap=mmap)
+    if vectors is not None:
+        return vectors
+
+    current = _read_json(os.path.join(root, "CURRENT.json"), {}).get("generation")
+    if current:
+        vectors, manifest = _load_generation(os.path.join(root, current), embeddings)
+    if vectors is None or manifest is None:
+        vectors, manifest = None, {"settings": settings, "files": {}}
+
+    ## start_index lets retrieval merge overlapping neighbours instead of sending the overlap twice
+    text_splitter = make_splitter(splitter_mode, chunk_size, chunk_overlap, add_start_index=True)
+    stale_ids, new_chunks, new_ids = [], [], []
+    files = manifest["files"]
+
+    for name in set(files) - set(file_hashes):
+        for page in files.pop(name)["pages"].values():
+            stale_ids.extend(page["chunk_ids"])
+
+    for name, file_sha in file_hashes.items():
+        old = files.get(name)
+        if old and old["sha256"] == file_sha:
+            continue
+        old_pages = old["pages"] if old else {}
+        with tracing.stage("load_pdf"):
+            pages = PyPDFLoader(os.path.join(pdf_dir, name)).load()
+        changed = [p for p in pages
+                   if old_pages.get(str(p.metadata.get("page", 0)), {}).get("hash") != text_sha256(p.page_content)]
+        with tracing.stage("split"):
+            chunks, ids, page_entries = _split_pages(changed, text_splitter, file_sha, name)
+
+        kept = {}
+        for page_no, entry in old_pages.items():
+            still_there = any(str(p.metadata.get("page", 0)) == page_no for p in pages)
+            if still_there and page_no not in page_entries:
+                kept[page_no] = entry
+            else:
+                stale_ids.extend(entry["chunk_ids"])
+        kept.update(page_entries)
+        files[name] = {"sha256": file_sha, "pages": kept}
+        new_chunks.extend(chunks)
+        new_ids.extend(ids)
+
+    if vectors is not None and stale_ids:
+        removable = prepare_for_delete(vectors)
+        if removable is None:
+            ## re-add the surviving chunks to a fresh store; their vectors come from the embedding cache
+            stale = set(stale_ids)
+            survivors = [(chunk_id, doc) for chunk_id, doc in vectors.docstore._dict.items() if chunk_id not in stale]
+            new_chunks = [doc for _, doc in survivors] + new_chunks
+            new_ids = [chunk_id for chunk_id, _ in survivors] + new_ids
+        else:
+            removable.delete(stale_ids)
+        vectors = removable
+    if new_chunks:
+        with tracing.stage("embed_index", documents=len(new_chunks)):
+            vectors = embed_into_faiss(new_chunks, embeddings, vectors, ids=new_ids, remote=remote,
+                                       on_progress=on_progress, **pipeline_options)
+    if vectors is None or not vectors.index.ntotal:
+        return None
+    with tracing.stage("build_ann_index"):
+        apply_index_type(vectors, index_type)
+
+    _save_generation(vectors, manifest, root, fingerprint, previous=current)
+    _prune_settings(index_dir, keep=root)
+    return vectors
+
+
+def _prune_settings(index_dir, keep):
+    """Drop indexes built with other settings; every settings change would otherwise leave one behind"""
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if path != keep and os.path.exists(os.path.join(path, "CURRENT.json")):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _save_generation(vectors, manifest, root, fingerprint, previous=None):
+    target = os.path.join(root, fingerprint)
+    ## write to a scratch dir and rename so a concurrent reader never sees half an index
+    tmp_path = f"{target}.tmp-{os.getpid()}"
+    vectors.save_local(tmp_path)
+    with open(os.path.join(tmp_path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    try:
+        os.replace(tmp_path, target)
+    except OSError:
+        ## another process finished the same generation first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    pointer_tmp = os.path.join(root, f"CURRENT.json.tmp-{os.getpid()}")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        json.dump({"generation": fingerprint}, f)
+    os.replace(pointer_tmp, os.path.join(root, "CURRENT.json"))
+
+    if previous and previous != fingerprint:
+        shutil.rmtree(os.path.join(root, previous), ignore_errors=True)
+
@@ -0,0 +1,138 @@
+"""
+Cold-start report and warm-up for the apps.
+
+    python warmup.py                  # time imports, then prepare every on-disk artifact
+    python warmup.py --imports-only   # only the import-time table
+
+Each module is imported in a fresh interpreter, so the import times are what
+the first run of an app pays. The warm-up steps then build (or load) the
+persisted research-paper index and download the sentence-transformers weights
+and tiktoken files, so the first visitor after a deploy only reads them from
+disk. Run it in the deploy or container build step, before `streamlit run`.
+Prints JSON; a failing step is reported and the others still run.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from dotenv import load_dotenv
+
+## third-party modules behind the apps
+IMPORTED_MODULES = (
+    "streamlit",
+    "langchain",
+    "langchain_community.vectorstores",
+    "langchain_community.document_loaders",
+    "langchain_openai",
+    "langchain_groq",
+    "langchain_huggingface",
+    "sentence_transformers",
+    "faiss",
+    "unstructured.partition.html",
+    "youtube_transcript_api",
+    "pymupdf",
+    "pypdf",
+    "tiktoken",
+    "fastapi",
+)
+## the repo's own modules, timed including everything they import at module level
+LOCAL_MODULES = (
+    "models",
+    "rag_chains",
+    "transcripts",
+    "retrievers",
+    "hybrid_retrieval",
+    "vector_store",
+    "url_summarizer",
+    "tracing",
+)
+
+
+def import_seconds(module):
+    """Wall time of `import module` in a new interpreter, or the error it raised"""
+    code = f"import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode:
+        lines = result.stderr.strip().splitlines()
+        return {"module": module, "error": lines[-1] if lines else f"exit status {result.returncode}"}
+    ## some packages print notices on import; the timing is the last line
+    return {"module": module, "seconds": round(float(result.stdout.strip().splitlines()[-1]), 3)}
+
+
+def import_report(modules=IMPORTED_MODULES + LOCAL_MODULES):
+    return [import_seconds(module) for module in modules]
+
+
+def run_step(name, step):
+    started = time.perf_counter()
+    try:
+        detail = step()
+    except Exception as e:
+        return {"step": name, "error": f"{type(e).__name__}: {e}"}
+    row = {"step": name, "seconds": round(time.perf_counter() - started, 3)}
+    if detail is not None:
+        row["detail"] = detail
+    return row
+
+
+def warm_research_index():
+    from models import RESEARCH_QA_MODEL, groq_llm, load_research_index, research_embeddings
+    vectors = load_research_index(research_embeddings(), groq_llm(RESEARCH_QA_MODEL), remote=True)
+    return {"chunks": vectors.index.ntotal if vectors is not None else 0}
+
+
+def warm_upload_embeddings():
+    from models import upload_embeddings
+    upload_embeddings().embed_query("warmup")
+
+
+def warm_tokenizer():
+    from tokens import estimate_tokens
+    estimate_tokens("warmup")
+
+
+def warm_reranker():
+    from langchain_core.documents import Document
+    from hybrid_retrieval import CrossEncoderReranker
+    CrossEncoderReranker().rerank("warmup", [Document(page_content="warmup")])
+
+
+def warmup(index=True, upload_model=True, reranker=False):
+    steps = [("tokenizer", warm_tokenizer)]
+    if upload_model:
+        steps.append(("upload_embeddings", warm_upload_embeddings))
+    if index:
+        steps.append(("research_index", warm_research_index))
+    if reranker:
+        steps.append(("reranker", warm_reranker))
+    return [run_step(name, step) for name, step in steps]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time cold imports and prepare the apps' on-disk caches")
+    parser.add_argument("--imports-only", action="store_true", help="only report import times")
+    parser.add_argument("--skip-imports", action="store_true", help="skip the import-time report")
+    parser.add_argument("--skip-index", action="store_true",
+                        help="do not build the research-paper index (needs OPENAI_API_KEY on a cold cache)")
+    parser.add_argument("--skip-upload-model", action="store_true", help="do not fetch the all-MiniLM-L6-v2 weights")
+    parser.add_argument("--reranker", action="store_true", help="also fetch the cross-encoder reranker weights")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+
+    report = {}
+    if not args.skip_imports:
+        report["imports"] = import_report()
+    if not args.imports_only:
+        report["warmup"] = warmup(index=not args.skip_index, upload_model=not args.skip_upload_model,
+                                  reranker=args.reranker)
+    print(json.dumps(report, indent=2))
+    return 1 if any("error" in row for row in report.get("warmup", [])) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())